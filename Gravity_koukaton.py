@@ -1,35 +1,104 @@
+import argparse
 import math
 import os
 import random
 import sys
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+STARTUP_T0 = time.perf_counter()  # 起動時間の計測の基準（このモジュールの読み込み開始時刻）
+import numpy as np
 import pygame as pg
 
+from assets import cache, texts
+from camera import CHUNK_SIZE, Camera
+from render import DirtyRenderer
+from levels import load_levels
+from pacing import FrameScheduler
+from particles import ParticleSystem, dot_frames
+from profiler import FrameProfiler
+from replay import InputRecorder, InputReplayer
+from spatial import SpatialHash
+
 
 WIDTH = 1100  # ゲームウィンドウの幅
 HEIGHT = 650  # ゲームウィンドウの高さ
 NUM_OF_FIRES = 5 # enemyの数
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+PHYSICS_FPS = 50  # 物理演算を1秒間に進める回数
+MAX_FPS = 144  # 描画の目標フレームレート（--fpsで変えられる）
+MAX_FRAME_TIME = 0.25  # 1回の描画で追いつく時間の上限[秒]（これを超えた分は捨てる）
+MAX_CHUNKS = 32  # 動かないものを描き込んで保持しておく区画の数の上限
+APPLE_WRAP = 10  # りんごが上下端から反対側に戻るときの，反対側の端からの距離[px]
+COAST_MARGIN = 64  # Game.coast()で床ととげをまとめて探す，こうかとんの周りの幅[px]
+EXPLOSION_PARTICLES = 300  # やられたときに飛び散る粒子の数
+FLIP_PARTICLES = 60  # 重力を反転したときに飛び散る粒子の数
+CLEAR_PARTICLES = 200  # ステージをクリアしたときに飛び散る粒子の数
+EXPLOSION_SCALES = (0.2, 0.3, 0.4, 0.5)  # 爆発の粒子の画像の拡大率（寿命が尽きるにつれて小さくなる）
 
 
-def check_bound(obj_rct: pg.Rect) -> tuple[bool, bool]:
+def stage_world(level: dict) -> pg.Rect:
+    """
+    ステージ全体の範囲を返す（"size"を省略したときと画面より小さいときは画面1枚分）
+    引数 level：ステージのデータ
+    戻り値：左上を(0, 0)とするステージ全体のRect
+    """
+    w, h = level.get("size", (WIDTH, HEIGHT))
+    return pg.Rect(0, 0, max(w, WIDTH), max(h, HEIGHT))
+
+
+def sweep_span(rct: pg.Rect, dy: int, target: pg.Rect) -> tuple[int, int] | None:
+    """
+    縦にdyだけ動いてrctに着いた物体が，動かないtargetと重なっていた道のりの範囲を求める
+    （横の移動は先に済んでいて，縦にだけ動いたものとする）
+    引数1 rct：移動後のRect
+    引数2 dy：縦方向の移動量
+    引数3 target：相手のRect
+    戻り値：動いた距離[px]が（始め, 終わり）の間（両端は含まない）にある間だけ重なる．道のりの中で重ならなければNone
+    """
+    if dy == 0 or rct.right <= target.left or target.right <= rct.left:
+        return None
+    if dy > 0:
+        span = (target.top - (rct.bottom - dy), target.bottom - (rct.top - dy))
+    else:
+        span = ((rct.top - dy) - target.bottom, (rct.bottom - dy) - target.top)
+    return span if span[0] < abs(dy) and span[1] > 0 else None
+
+
+def check_bound(obj_rct: pg.Rect, bounds: pg.Rect | None = None) -> tuple[bool, bool]:
     """
     オブジェクトが画面内or画面外を判定し，真理値タプルを返す関数
-    引数：こうかとんや爆弾，ビームなどのRect
+    引数1：こうかとんや爆弾，ビームなどのRect
+    引数2：はみ出しを判定する範囲（省略時は画面，画面より大きいステージではステージ全体）
     戻り値：横方向，縦方向のはみ出し判定結果（画面内：True／画面外：False）
     """
+    left, top, right, bottom = (0, 0, WIDTH, HEIGHT) if bounds is None else (
+        bounds.left, bounds.top, bounds.right, bounds.bottom)
     yoko, tate = True, True
-    if obj_rct.left < 0 or WIDTH < obj_rct.right:
+    if obj_rct.left < left or right < obj_rct.right:
         yoko = False
-    if obj_rct.top < 0 or HEIGHT < obj_rct.bottom:
+    if obj_rct.top < top or bottom < obj_rct.bottom:
         tate = False
     return yoko, tate
 
 
+def lerp_pos(prev: pg.Rect, cur: pg.Rect, alpha: float) -> tuple[float, float]:
+    """
+    2つのRectの左上座標の間を線形補間する
+    引数1 prev：1ステップ前のRect
+    引数2 cur：現在のRect
+    引数3 alpha：補間の割合（0.0でprev，1.0でcur）
+    戻り値：補間した左上座標
+    """
+    return (prev.x + (cur.x - prev.x) * alpha,
+            prev.y + (cur.y - prev.y) * alpha)
+
+
 class Gravity:
     """
     重力とジャンプを管理するクラス
     """
+    __slots__ = ("gravity", "jump_power", "flag")
+
     def __init__(self, gravity: float = 0.5, jump_power: float = -10):
         """
         初期化
@@ -68,219 +137,367 @@ class Bird:
     """
     ゲームキャラクター（こうかとん）に関するクラス
     """
+    __slots__ = ("img", "rct", "prev_rct", "dire", "vy", "gravity_maneger", "reversing", "g_switch", "bounds")
+
     delta = {  # 押下キーと移動量の辞書
         pg.K_LEFT: (-3, 0),
         pg.K_RIGHT: (+3, 0),
     }
-    img0 = pg.transform.rotozoom(pg.image.load("fig/3.png"), 0, 0.9)
-    img = pg.transform.flip(img0, True, False)  # デフォルトのこうかとん（右向き）
-    imgs = {
-            (+3, 0): img,  # 右
-            (-3, 0): img0,  # 左
+    game_over_nums = (8,)  # change_img()で使うこうかとん画像ファイル名の番号
+    img0: pg.Surface | None = None  # 左向きのこうかとん（load_images()で読み込む）
+    img1: pg.Surface | None = None  # デフォルトのこうかとん（右向き）
+    imgs: dict[tuple[int, int], pg.Surface] = {}
+    sprites: dict[tuple[tuple[int, int], bool], pg.Surface] = {}  # （向き, 上下反転）→画像
+    game_over_imgs: dict[int, pg.Surface] = {}  # 番号→ゲームオーバー時の画像
+    masks: dict[tuple[tuple[int, int], bool], pg.mask.Mask] = {}  # （向き, 上下反転）→当たり判定用のマスク
+
+    @classmethod
+    def load_images(cls):
+        """
+        こうかとんの画像を向きと上下反転の組み合わせごとに用意する（用意済みなら何もしない）
+        画面を作った後に呼ぶと画面のピクセル形式に変換される
+        """
+        if cls.img1 is not None:
+            return
+        cls.img0 = cache.image("fig/3.png", scale=0.9)
+        cls.img1 = cache.image("fig/3.png", scale=0.9, flip_x=True)
+        cls.imgs = {
+            (+3, 0): cls.img1,  # 右
+            (-3, 0): cls.img0,  # 左
+        }
+        cls.sprites = {
+            (dire, flipped): cache.image("fig/3.png", scale=0.9, flip_x=dire[0] > 0, flip_y=flipped)
+            for dire in cls.imgs for flipped in (False, True)
+        }
+        cls.masks = {
+            (dire, flipped): cache.mask("fig/3.png", scale=0.9, flip_x=dire[0] > 0, flip_y=flipped)
+            for dire, flipped in cls.sprites
         }
+        cls.game_over_imgs = {num: cache.image(f"fig/{num}.png", scale=0.9) for num in cls.game_over_nums}
 
     def __init__(self, xy: tuple[int, int], gravity_manager: "Gravity"):
         """
         こうかとん画像Surfaceを生成する
         引数 xy：こうかとん画像の初期位置座標タプル
         """
+        __class__.load_images()
         self.img = __class__.imgs[(+3, 0)]
         self.rct: pg.Rect = self.img.get_rect()
         self.rct.center = xy
+        self.prev_rct = self.rct.copy()  # 1ステップ前の位置（描画の補間用）
 
         self.dire = (+3, 0)
         self.vy = 0
         self.gravity_maneger = gravity_manager
-        self.reversing = False
+        self.reversing = False  # 上下反転して描くか
         self.g_switch =False
+        self.bounds = pg.Rect(0, 0, WIDTH, HEIGHT)  # 動ける範囲（ステージ全体）
 
-    def change_img(self, num: int, screen: pg.Surface):
+    def change_img(self, num: int, screen: pg.Surface, offset: tuple[int, int] = (0, 0)):
         """
         こうかとん画像を切り替え，画面に転送する
         引数1 num：こうかとん画像ファイル名の番号
         引数2 screen：画面Surface
+        引数3 offset：ワールド座標から画面上の座標へのずれ（Camera.offset）
         """
-        self.img = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.9)
+        self.img = __class__.game_over_imgs.get(num) or cache.image(f"fig/{num}.png", scale=0.9)
+        screen.blit(self.img, self.rct.move(offset))
 
-        screen.blit(self.img, self.rct)
-
-    def update(self, key_lst: list[bool], screen: pg.Surface):
+    def update(self, key_lst: list[bool]):
         """
         押下キーに応じてこうかとんを移動させる
-        引数1 key_lst：押下キーの真理値リスト
-        引数2 screen：画面Surface
+        引数 key_lst：押下キーの真理値リスト
         """
+        self.prev_rct.topleft = self.rct.topleft
         sum_mv = [0, 0]
         for k, mv in __class__.delta.items():
             if key_lst[k]:
                 sum_mv[0] += mv[0]
         self.rct.move_ip(sum_mv)
-        if check_bound(self.rct) != (True, True):
+        if check_bound(self.rct, self.bounds) != (True, True):
             self.rct.move_ip(-sum_mv[0], -sum_mv[1])
-        if not (sum_mv[0] == 0 and sum_mv[1] == 0):
-            self.img = __class__.imgs[tuple(sum_mv)]
-            self.dire = sum_mv
         self.vy = self.gravity_maneger.apply_gravity(self.vy)
         self.rct.centery += self.vy
 
         # 地面・天井判定
         if self.gravity_maneger.gravity > 0:
             # 地面判定
-            if self.rct.bottom >= HEIGHT:
-                self.rct.bottom = HEIGHT
+            if self.rct.bottom >= self.bounds.bottom:
+                self.rct.bottom = self.bounds.bottom
                 self.vy = 0
                 self.gravity_maneger.flag = False
                
         # 天井判定
         else:
-            if self.rct.top <= 0:
-                self.rct.top = 0
+            if self.rct.top <= self.bounds.top:
+                self.rct.top = self.bounds.top
                 self.vy = 0 
 
         # 横方向の向きを更新
         if not (sum_mv[0] == 0 and sum_mv[1] == 0):
-            self.img = __class__.imgs[tuple(sum_mv)]
-            if  self.g_switch:
-                self.img = pg.transform.flip(self.img, False, True)
+            self.dire = (sum_mv[0], sum_mv[1])
+        self.img = __class__.sprites[(self.dire, self.reversing)]
 
-            self.dire = sum_mv
-        
-        if self.reversing:
-            self.img = pg.transform.flip(self.img, False, True)
-            self.flip_v()
-        screen.blit(self.img, self.rct)
+    @property
+    def mask(self) -> pg.mask.Mask:
+        """
+        今の画像（向きと上下反転）に合った当たり判定用のマスク
+        """
+        return __class__.masks[(self.dire, self.reversing)]
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0, offset: tuple[int, int] = (0, 0)) -> pg.Rect:
+        """
+        こうかとんを画面に転送する
+        引数1 screen：画面Surface
+        引数2 alpha：1ステップ前の位置と現在位置の間のどこに描くか（0.0～1.0）
+        引数3 offset：ワールド座標から画面上の座標へのずれ（Camera.offset）
+        戻り値：描画した範囲
+        """
+        x, y = lerp_pos(self.prev_rct, self.rct, alpha)
+        return screen.blit(self.img, (x + offset[0], y + offset[1]))
     
     def flip_v(self):
         """
         こうかとん描写の上下反転
         """
         self.reversing = not self.reversing
+        self.img = __class__.sprites[(self.dire, self.reversing)]
 
 
 class Stege:
     """
     ステージに関するクラス
     """
-    def __init__(self):
-        #ステージを描画する四角形
-        self.images = [
-        [pg.Rect(0,500,300,20),
-        pg.Rect(250,250,300,20),
-        pg.Rect(500,500,300,20),
-        pg.Rect(750,250,300,20),
-        pg.Rect(1000,500,300,20)],
-        [pg.Rect(0,560,80, 20),
-        pg.Rect(100,350,40,20),
-        pg.Rect(120,40,100,20),
-        pg.Rect(225,570,50,20),
-        pg.Rect(335,570,40,20),
-        pg.Rect(440,570,100,20),
-        pg.Rect(470,60,100,20),
-        pg.Rect(640,60,100,20),
-        pg.Rect(720,300,80,20),
-        pg.Rect(830,60,80,20),
-        pg.Rect(970,500,100,20)],
-        [pg.Rect(30,580,20,20),
-        pg.Rect(80,70,20,20),
-        pg.Rect(140,580,20,20),
-        pg.Rect(190,70,20,20),
-        pg.Rect(232,580,20,20),
-        pg.Rect(360,70,20,20),
-        pg.Rect(480,580,20,20),
-        pg.Rect(600,70,20,20),
-        pg.Rect(705,70,20,20),
-        pg.Rect(820,450,20,20),
-        pg.Rect(900,580,20,20),
-        pg.Rect(970,10,200,20),
-        ]
-        ]
-        self.door_positions = [
-            (1050, 460),  # ステージ1のドアの座標
-            (1020, 450),  # ステージ2のドアの座標
-            (1000, 100)   # ステージ3のドアの座標
-        ]
-        self.apple_positions = [
-            [Enemy(400, 15, 2),
-        Enemy(400, 138, 2),
-        Enemy(400, 266, 2),
-        Enemy(400, 394, 2),
-        Enemy(400, 522, 2)],
-
-            [Enemy(700, 15, -1),
-        Enemy(700, 138, -1),
-        Enemy(700, 266, -1),
-        Enemy(700, 394, -1),
-        Enemy(700, 522, -1)],
-
-        [Enemy(1050, 15, -2),
-        Enemy(1050, 138, -2),
-        Enemy(1050, 266, -2),
-        Enemy(1050, 394, -2),
-        Enemy(1050, 522, -2)],
-        
-            [Enemy(700, 15, -2),
-        Enemy(700, 138, -2),
-        Enemy(700, 266, -2),
-        Enemy(700, 394, -2),
-        Enemy(700, 522, -2)],
-
-        [Enemy(300, 15, 1),
-        Enemy(300, 138, 1),
-        Enemy(300, 266, 1),
-        Enemy(300, 394, 1),
-        Enemy(300, 522, 1)],
-        
-            [Enemy(1000, 15, 2),
-        Enemy(1000, 138, 2),
-        Enemy(1000, 266, 2),
-        Enemy(1000, 394, 2),
-        Enemy(1000, 522, 2)]
-        ]
-        self.current_stage_index = 0
-        self.image = self.images[self.current_stage_index]
-        self.apple1 = self.apple_positions[self.current_stage_index]
-        self.apple2 = self.apple_positions[self.current_stage_index+3]
+    preloader: ThreadPoolExecutor | None = None  # 次のステージを用意するスレッド（preload=Trueで初めて使うときに作る）
+
+    def __init__(self, levels: list[dict] | None = None, preload: bool = False):
+        """
+        ステージデータを読み込み，最初のステージを用意する
+        引数1 levels：ステージごとのデータのリスト（省略時はステージデータファイルから読み込む）
+        引数2 preload：遊んでいる間に次のステージを別スレッドで用意しておくか
+        """
+        # ステージのデータ（座標など）だけを持ち，オブジェクトは入ったステージの分だけ作る
+        self.levels = load_levels() if levels is None else levels
+        self.preload = preload
         self.display_stage_message = False  # ステージ切り替え時の表示フラグ
         self.message_timer = 0  # ステージ切り替えメッセージの表示時間
-        self.door_image = pg.image.load("fig/wooden-door.png")  # ドアの画像をロード
-        self.door_rect = self.door_image.get_rect()
-        self.display_stage_message = False  # ステージ切り替え時の表示フラグ
-        self.message_timer = 0
         #ドアのサイズをbirdと同じにする
-        bird_size = Bird.img.get_size()
-        self.door_image = pg.transform.scale(pg.image.load("fig/wooden-door.png"), bird_size)
-        self.door_rect = self.door_image.get_rect()
+        Bird.load_images()
+        bird_size = Bird.img1.get_size()
+        self.door_image = cache.image("fig/wooden-door.png", size=bird_size)
+        self.door_rect = None
         self.goal = False
+        self._static_layer: pg.Surface | None = None  # 画面に映る範囲の動かないものを描き込んだ画像
+        self._static_view: tuple[int, int] | None = None  # _static_layerに描いた範囲の左上
+        self._chunks: OrderedDict[tuple[int, int], pg.Surface] = OrderedDict()  # 区画ごとの動かないものの画像
+        self._next: tuple[int, Future] | None = None  # 用意中の（ステージ番号, build_stage()の結果）
+        self.load_stage(0)
+
+    def build_stage(self, index: int, prerender: bool = False) -> dict:
+        """
+        指定したステージの床・りんご・とげ・ドアと当たり判定用の空間ハッシュを作る
+        selfの状態は変えないので，preloaderのスレッドからも呼べる
+        引数1 index：ステージ番号
+        引数2 prerender：スタート地点の周りの区画の画像も描いておくか
+        戻り値：load_stage()で入れ替えるステージの部品の辞書
+        """
+        level = self.levels[index]
+        world = stage_world(level)  # ステージ全体の範囲
+        image = [pg.Rect(rect) for rect in level["platforms"]]  #ステージを描画する四角形
+        #とげの列（最初のとげの中心座標, 本数, 向き）
+        thorns = [ThornStrip(tuple(xy), count, direction) for xy, count, direction in level["thorns"]]
+        platform_grid = SpatialHash()  # 床の当たり判定用
+        for rect in image:
+            platform_grid.insert(rect, rect)
+        thorn_grid = SpatialHash()  # とげの当たり判定用
+        for thorn in thorns:
+            thorn_grid.insert(thorn, thorn.rct)
+        parts = {
+            "world": world,
+            "image": image,
+            "apples": Enemies(level["apples"], world.height),
+            "thorns": thorns,
+            "platform_grid": platform_grid,
+            "thorn_grid": thorn_grid,
+            "door_rect": None if level["door"] is None else self.door_image.get_rect(topleft=level["door"]),
+            "chunks": OrderedDict(),
+        }
+        if prerender:
+            camera = Camera((WIDTH, HEIGHT), world.size)
+            camera.follow(level["start"])
+            for cx, cy in camera.chunks():
+                parts["chunks"][(cx, cy)] = self.render_chunk(cx, cy, parts)
+        return parts
+
+    def load_stage(self, index: int):
+        """
+        指定したステージの床・りんご・とげを生成する（前のステージのものは手放す）
+        preloaderで用意済みならそれを使い，間に合っていなければその場で作る
+        引数 index：ステージ番号
+        """
+        parts = None
+        if self._next is not None and self._next[0] == index:
+            future = self._next[1]
+            if future.done() or not future.cancel():  # 作り始めていたら，最初から作るより待つ方が早い
+                parts = future.result()
+        self._next = None
+        if parts is None:
+            parts = self.build_stage(index)
+        # 部品はまとめて入れ替えるので，前のステージと次のステージのものが混ざることはない
+        self.current_stage_index = index
+        self.world = parts["world"]
+        self.image = parts["image"]
+        self.apples = parts["apples"]
+        self.thorns = parts["thorns"]
+        self.platform_grid = parts["platform_grid"]
+        self.thorn_grid = parts["thorn_grid"]
+        self.door_rect = parts["door_rect"]
+        self._chunks = parts["chunks"]
+        self._static_layer = None  # ステージごとに別のSurfaceにして，描画側に画面全体を描き直させる
+        if pg.font.get_init():  # ステージ切り替え時の文字を先に描画しておく
+            texts.render(f"stage {index + 1}", 50, (0, 0, 0))
+            if index == len(self.levels) - 1:
+                texts.render("Game Clear!", 100, (0, 0, 0))
+                texts.render("Goal", 100, (0, 0, 0))
+        if self.preload and index + 1 < len(self.levels):
+            if __class__.preloader is None:
+                __class__.preloader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stage")
+            self._next = (index + 1, __class__.preloader.submit(self.build_stage, index + 1,
+                                                                pg.display.get_surface() is not None))
+
+    @classmethod
+    def shutdown_preloader(cls):
+        """
+        次のステージを用意するスレッドを止める（まだ作り始めていないものは取り消す）
+        """
+        if cls.preloader is not None:
+            cls.preloader.shutdown(cancel_futures=True)
+            cls.preloader = None
+
+    def static_layer(self, camera: Camera | None = None) -> pg.Surface:
+        """
+        背景・床・ドア・とげのうち，カメラに映る範囲を描き込んだ画像を返す
+        区画ごとに描き込んだ画像を並べて作り，カメラが動くかステージが変わるまでは同じものを返す
+        ステージが変わると別のSurfaceを返すので，描画側はSurfaceが変わったら画面全体を描き直せばよい
+        引数 camera：カメラ（省略時はステージの左上の画面1枚分）
+        戻り値：画面と同じ大きさのSurface
+        """
+        view = (0, 0) if camera is None else camera.view.topleft
+        if self._static_layer is None:
+            layer = pg.Surface((WIDTH, HEIGHT))
+            if pg.display.get_surface() is not None:
+                layer = layer.convert()
+            self._static_layer = layer
+            self._static_view = None
+        if self._static_view != view:
+            x, y = view
+            cx0, cy0 = x // CHUNK_SIZE, y // CHUNK_SIZE
+            cx1, cy1 = (x + WIDTH - 1) // CHUNK_SIZE, (y + HEIGHT - 1) // CHUNK_SIZE
+            self._static_layer.blits([(self.chunk_layer(cx, cy), (cx * CHUNK_SIZE - x, cy * CHUNK_SIZE - y))
+                                      for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)])
+            self._static_view = view
+        return self._static_layer
+
+    def chunk_layer(self, cx: int, cy: int) -> pg.Surface:
+        """
+        1つの区画の背景・床・ドア・とげを描き込んだ画像を返す（なければ作り，古いものから捨てる）
+        引数1 cx：区画の横の番号
+        引数2 cy：区画の縦の番号
+        戻り値：一辺CHUNK_SIZEの正方形のSurface
+        """
+        key = (cx, cy)
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+            return chunk
+        chunk = self.render_chunk(cx, cy)
+        self._chunks[key] = chunk
+        if len(self._chunks) > MAX_CHUNKS:
+            self._chunks.popitem(last=False)
+        return chunk
+
+    def render_chunk(self, cx: int, cy: int, parts: dict | None = None) -> pg.Surface:
+        """
+        1つの区画の背景・床・ドア・とげを描き込んだ画像を作る
+        引数1 cx：区画の横の番号
+        引数2 cy：区画の縦の番号
+        引数3 parts：描くステージの部品（build_stage()の戻り値．省略時は今のステージ）
+        戻り値：一辺CHUNK_SIZEの正方形のSurface
+        """
+        area = pg.Rect(cx * CHUNK_SIZE, cy * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+        chunk = pg.Surface(area.size)
+        if pg.display.get_surface() is not None:
+            chunk = chunk.convert()
+        bg = cache.image("fig/pg_bg.jpg")  # 背景はステージ全体に敷き詰める
+        bw, bh = bg.get_size()
+        for y in range(area.top - area.top % bh, area.bottom, bh):
+            for x in range(area.left - area.left % bw, area.right, bw):
+                chunk.blit(bg, (x - area.left, y - area.top))
+        self.draw_static(chunk, area, parts)
+        return chunk
+
     def draw(self, screen: pg.Surface):
         """
         ステージ、ドア、文字の描画とゴールの処理
         引き値:　pg.Surface
         戻り値:
         """
-        for x in self.image:
-            pg.draw.rect(screen, (0, 0, 0), x)
+        self.draw_static(screen)
+        self.draw_message(screen)
+
+    def draw_static(self, screen: pg.Surface, area: pg.Rect | None = None, parts: dict | None = None):
+        """
+        ステージ内で動かない床とドアととげを描画する
+        引数1 screen：描画先のSurface
+        引数2 area：描画するワールド座標の範囲（screenの左上がこの範囲の左上になる．省略時はすべて）
+        引数3 parts：描くステージの部品（build_stage()の戻り値．省略時は今のステージ）
+        """
+        if parts is None:
+            parts = {"image": self.image, "thorns": self.thorns, "platform_grid": self.platform_grid,
+                     "thorn_grid": self.thorn_grid, "door_rect": self.door_rect}
+        if area is None:
+            platforms, thorns, offset = parts["image"], parts["thorns"], (0, 0)
+        else:  # 範囲の近くにあるものだけを空間ハッシュで探す
+            platforms = parts["platform_grid"].query(area)
+            thorns = parts["thorn_grid"].query(area)
+            offset = (-area.x, -area.y)
+        for x in platforms:
+            pg.draw.rect(screen, (0, 0, 0), x.move(offset))
         #ドアの描画
-        if self.door_rect:
-            screen.blit(self.door_image, self.door_rect)
+        door_rect = parts["door_rect"]
+        if door_rect:
+            screen.blit(self.door_image, door_rect.move(offset))
+        for thorn in thorns:
+            thorn.draw(screen, offset)
+
+    def draw_message(self, screen: pg.Surface) -> list[pg.Rect]:
+        """
+        ステージ切り替えやゴールの文字を描画する
+        引数 screen：描画先のSurface
+        戻り値：描画した範囲のリスト
+        """
+        rects = []
         #ステージ変更時に文字を描画
         if self.display_stage_message:
-            font = pg.font.Font(None, 50)
-            text = font.render(f"stage {self.current_stage_index + 1}", True, (0, 0, 0))
+            text = texts.render(f"stage {self.current_stage_index + 1}", 50, (0, 0, 0))
             text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            self.apple1 = self.apple_positions[self.current_stage_index]
-            self.apple2 = self.apple_positions[self.current_stage_index+3]
-            screen.blit(text, text_rect)
-            self.message_timer += 1
-            if self.message_timer > 100:  
-                self.display_stage_message = False
-                self.message_timer = 0
+            rects.append(screen.blit(text, text_rect))
         #ゴール処理
         if self.goal:
-            font = pg.font.Font(None, 100)
-            text = font.render("Game Clear!", True, (0,0,0))
+            text = texts.render("Game Clear!", 100, (0, 0, 0))
             text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            screen.blit(text, text_rect)
-        
+            rects.append(screen.blit(text, text_rect))
+        return rects
+
+    def update(self):
+        """
+        ステージ切り替えメッセージの表示時間を進める
+        """
+        if self.display_stage_message:
+            self.message_timer += 1
+            if self.message_timer > 100:
+                self.display_stage_message = False
+                self.message_timer = 0
 
     def hit_stage(self, bird: Bird):
         """
@@ -289,7 +506,7 @@ class Stege:
         戻り値:Birdが地面やドアに接触したかどうか
         """
         bird_hit_stage = False
-        for rect in self.image:
+        for rect in self.platform_grid.query(bird.rct):
             if bird.g_switch == False:  # 通常の重力（下向き）
                 if bird.rct.colliderect(rect) and bird.rct.bottom > rect.top:
                     bird.rct.bottom = rect.top
@@ -306,97 +523,203 @@ class Stege:
 
         # ドアに触れた場合の処理
         if self.door_rect and bird.rct.colliderect(self.door_rect):
-            if self.current_stage_index == len(self.images) - 1:  # 最終ステージの場合
+            if self.current_stage_index == len(self.levels) - 1:  # 最終ステージの場合
                 self.goal = True
             else:
-                self.current_stage_index += 1
-                self.image = self.images[self.current_stage_index]
+                self.load_stage(self.current_stage_index + 1)
                 self.display_stage_message = True
                 self.setup_door(bird)
             return True
 
         bird.gravity_maneger.flag = not bird_hit_stage
         return bird_hit_stage
-    
+
+    def sweep(self, bird: Bird) -> tuple[float, str] | None:
+        """
+        Bird.update()で縦に動いた道のりを掃いて，床・とげ・りんごに最初に当たった時刻を求める
+        床を丸ごと通り抜けていたらその床と1pxだけ重なる位置まで戻し（次のステップのhit_stage()でいつも通り床に乗る），
+        その手前でとげかりんごに画素単位で当たっていたら当たった位置まで戻す
+        横の移動はBird.update()で先に済むので，移動後の横位置のまま縦に動いたものとして調べる
+        引数:Birdオブジェクト
+        戻り値：（時刻（移動前が0，移動後が1）, 当たったもの（"platform"，"thorn"，"enemy"））のタプル
+                （自分の高さ以下の移動のときと，何にも当たらなかったときはNone）
+        """
+        prev, rct = bird.prev_rct, bird.rct
+        dy = rct.y - prev.y
+        dist = abs(dy)
+        if dist <= rct.height:  # 自分の高さ以下の移動では何も通り抜けられず，移動後の判定で足りる
+            return None
+        box = prev.union(rct)
+        stop = dist  # 調べる道のりの長さ（床で止まるならそこまで）
+        for rect in self.platform_grid.query(box):
+            span = sweep_span(rct, dy, rect)
+            if span is not None and span[0] >= 0 and span[1] <= dist:  # 丸ごと通り抜けた
+                stop = min(stop, span[0] + 1)
+        # とげとりんごは止まる位置の手前だけ調べる（止まる位置はいつも通りstep()で調べる）
+        hazards = [(thorn.rct, thorn.mask, "thorn") for thorn in self.thorn_grid.query(box)]
+        apples = self.apples
+        near = ((apples.left < box.right) & (apples.right > box.left)
+                & (apples.top < box.bottom) & (apples.top > box.top - apples.h))
+        hazards += [(pg.Rect(int(apples.left[i]), int(apples.top[i]), apples.w, apples.h), apples.mask, "enemy")
+                    for i in np.flatnonzero(near).tolist()]
+        mask, sign = bird.mask, 1 if dy > 0 else -1
+        hit = None  # （当たるまでに動いた距離, 当たったもの）
+        for target, target_mask, kind in hazards:
+            span = sweep_span(rct, dy, target)
+            if span is None:
+                continue
+            for d in range(max(span[0] + 1, 1), min(span[1], stop if hit is None else hit[0])):
+                if mask.overlap(target_mask, (target.x - rct.x, target.y - prev.y - sign * d)) is not None:
+                    hit = (d, kind)
+                    break
+        if hit is None:
+            if stop == dist:
+                return None
+            hit = (stop, "platform")
+        rct.y = prev.y + sign * hit[0]
+        return hit[0] / dist, hit[1]
+
     def setup_door(self, bird: Bird):
         """
-        ステージに応じてドアを設定し、必要に応じてBirdの初期位置を更新する
+        Birdをステージの初期位置に置き，画面があればスタート地点の周りの画像を用意する
+        （ドアはload_stage()で設定済み）
         引数:
         bird: Birdオブジェクト
         """
-        if self.current_stage_index < len(self.door_positions):
-            door_position = self.door_positions[self.current_stage_index]
-            self.door_rect.topleft = door_position  # ドアの位置を更新
+        level = self.levels[self.current_stage_index]
+        bird.rct.center = level["start"]  # Birdをステージの初期位置に置く
+        bird.bounds = self.world
+        self._static_view = None
+        if pg.display.get_surface() is not None:  # 先に用意した区画がなければここで描く
+            camera = Camera((WIDTH, HEIGHT), self.world.size)
+            camera.follow(bird.rct.center)
+            self.static_layer(camera)
 
-            if self.current_stage_index == 2:  # ステージ3の場合
-                bird.rct.center = (30, 500)  # Birdの位置をステージ3用に変更
-            else:
-                bird.rct.center = (30, 540)  # Birdを初期位置に戻す
-        else:
-            self.door_rect = None  # ドアがない場合
-# class Explosion:
-#     """
-#     爆発に関するクラス
-#     """
-#     def __init__(self, bomb:"Bomb"):
-#         """
-#         爆弾の位置に爆発のgifを描画する
-#         引数：爆弾のクラス
-#         """
-#         self.life = 100
-#         self.img = pg.image.load(f"fig/explosion.gif")
-#         self.img_rct = self.img.get_rect()
-#         self.img_rct.center = bomb.rct.center
-
-#     def update(self, screen: pg.Surface):
-#         """
-#         爆発をlifeの時間分画像を反転させながら描画する
-#         引数 screen:画面のSurface
-#         """
-#         self.life -= 1
-#         if self.life > 0:
-#             if self.life % 2 == 0:
-#                 self.img = pg.transform.flip(self.img, -1, -1)
-#             screen.blit(self.img, self.img_rct)
-
-
-class Enemy:
-    """
-    こうかとんをこの世から消し去るためステージに置かれるりんごのクラス
-    """
-    def __init__(self, x:int, y:int, speed):
-        """
-        りんごの読み込みと初期速度
-        """
-        self.vy = speed
-        self.img = pg.transform.rotozoom(pg.image.load(f"fig/ringo.png"), 0, 0.05)
-        self.rct = self.img.get_rect()
-        self.rct.center = (x, y)
-        self.rct.top = y
-        self.x = x
-        self.y = y
 
-    def update(self, screen: pg.Surface):
+class Enemies:
+    """
+    こうかとんをこの世から消し去るためステージに置かれるりんごをまとめて扱うクラス
+    位置と速度をNumPy配列で持ち，移動・折り返し・当たり判定を一括で行う
+    """
+    __slots__ = ("height", "img", "mask", "w", "h", "left", "right", "top", "vy", "prev_top")
+
+    def __init__(self, specs: list[tuple[int, int, int]], height: int = HEIGHT):
+        """
+        りんごの読み込みと初期位置・速度
+        引数1 specs：りんごごとの（中心x座標, 上端y座標, 縦方向の速度）のリスト
+        引数2 height：ステージの高さ（この上下端で反対側に戻す）
+        """
+        self.height = height
+        self.img = cache.image("fig/ringo.png", scale=0.05)
+        self.mask = cache.mask("fig/ringo.png", scale=0.05)  # りんごの形の当たり判定
+        self.w, self.h = self.img.get_size()
+        arr = np.array(specs, dtype=np.int64).reshape(-1, 3)
+        self.left = arr[:, 0] - self.w // 2
+        self.right = self.left + self.w  # りんごは横には動かない
+        self.top = arr[:, 1].copy()
+        self.vy = arr[:, 2].copy()
+        self.prev_top = self.top.copy()  # 1ステップ前の位置（描画の補間用）
+
+    def __len__(self) -> int:
+        return len(self.top)
+
+    def update(self):
+        """
+        りんごを速度self.vyに基づき移動させ，画面の上下端で反対側に戻す
+        """
+        self.prev_top[:] = self.top
+        __class__.move_tops(self.top, self.vy, self.h, self.height)
+
+    @staticmethod
+    def move_tops(top: np.ndarray, vy: np.ndarray, h: int, height):
+        """
+        りんごの上端y座標の配列をその場で1ステップ進める（update()の中身．VectorEnvからも使う）
+        引数1 top：上端y座標の配列
+        引数2 vy：縦方向の速度の配列
+        引数3 h：りんごの高さ
+        引数4 height：ステージの高さ（topと同じ形に広げられる配列でもよい）
+        """
+        top[top + h >= height] = APPLE_WRAP
+        wrap = top <= 0
+        top[wrap] = np.broadcast_to(height - APPLE_WRAP - h, top.shape)[wrap]
+        top += vy
+
+    def position_after(self, n) -> np.ndarray:
+        """
+        update()をn回呼んだ後のりんごの上端y座標を計算する（りんご自体は動かさない）
+        折り返すまでは等速で動き，折り返した後は一定の周期で同じ位置を繰り返すことを使う
+        引数 n：ステップ数（1以上．形が(k, 1)の配列ならk通りをまとめて計算する）
+        戻り値：上端y座標の配列
+        """
+        top, vy = self.top, self.vy
+        limit = self.height - self.h  # 上端がここ以上になると上に戻る
+        w = np.maximum(np.abs(vy), 1)
+        down = vy > 0
+        # 最初に折り返すまでのステップ数a，折り返した直後の位置c0，その後の周期period
+        a = np.maximum(np.where(down, (limit - top + w - 1) // w, (top + w - 1) // w), 0)
+        a[vy == 0] = np.iinfo(a.dtype).max
+        c0 = np.where(down, APPLE_WRAP + w, limit - APPLE_WRAP - w)
+        period = np.maximum(np.where(down, (limit - c0 + w - 1) // w, (c0 + w - 1) // w), 0) + 1
+        return np.where(n <= a, top + vy * n, c0 + vy * ((n - a - 1) % period))
+
+    def advance(self, n: int):
+        """
+        update()をn回呼んだのと同じ位置まで一度に進める
+        引数 n：ステップ数
+        """
+        if n <= 0:
+            return
+        top, vy = self.top, self.vy
+        limit = self.height - self.h
+        regular = ((vy > 0) & (top > 0)) | ((vy < 0) & (top < limit)) | ((vy == 0) & (top > 0) & (top < limit))
+        if n == 1 or not regular.all():  # 画面の外から始まるりんごがあるときは1ステップずつ進める
+            for _ in range(n):
+                self.update()
+            return
+        self.prev_top[:], top[:] = self.position_after(np.array([[n - 1], [n]]))
+
+    def hits(self, rct: pg.Rect, mask: pg.mask.Mask | None = None) -> bool:
         """
-        りんごを速度ベクトルself.vyに基づき移動させる
-        引数 screen：画面Surface
+        いずれかのりんごがRectと重なっているかを判定する
+        maskを渡すと，Rectが重なったりんごだけを画素単位で確かめる（透明な角では当たらない）
+        引数1 rct：判定するRect
+        引数2 mask：rctの左上に置いた物体のマスク（省略時はRectだけで判定する）
+        戻り値：重なっていればTrue
         """
-        if self.rct.bottom >= HEIGHT:
-            self.rct.top = 10
-        if self.rct.top <= 0:
-            self.rct.bottom = 640
-        self.rct.move_ip(0, self.vy)
-        screen.blit(self.img, self.rct)
-        # self.life -= 1
-        # if self.life > 0:
-        #     if self.life % 2 == 0:
-        #         self.img = pg.transform.flip(self.img, -1, -1)
-        #     screen.blit(self.img, self.img_rct)
+        top = self.top
+        near = ((self.left < rct.right) & (self.right > rct.left)
+                & (top < rct.bottom) & (top > rct.top - self.h))
+        if mask is None:
+            return bool(near.any())
+        for i in np.flatnonzero(near).tolist():
+            if mask.overlap(self.mask, (int(self.left[i]) - rct.x, int(top[i]) - rct.y)):
+                return True
+        return False
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0, view: pg.Rect | None = None) -> list[pg.Rect]:
+        """
+        りんごをまとめて画面に転送する
+        引数1 screen：画面Surface
+        引数2 alpha：1ステップ前の位置と現在位置の間のどこに描くか（0.0～1.0）
+        引数3 view：画面に映すワールド座標の範囲（Camera.view．範囲外のりんごは描かない）
+        戻り値：描画した範囲のリスト
+        """
+        dy = self.top - self.prev_top
+        # 画面端で折り返した直後は補間しない
+        ys = np.where(np.abs(dy) <= np.abs(self.vy), self.prev_top + dy * alpha, self.top)
+        xs = self.left
+        if view is not None:
+            shown = (xs < view.right) & (self.right > view.left) & (ys < view.bottom) & (ys + self.h > view.top)
+            xs, ys = xs[shown] - view.x, ys[shown] - view.y
+        img = self.img
+        return screen.blits([(img, pos) for pos in zip(xs.tolist(), ys.tolist())])
 
 
 class ClearObj:
+    __slots__ = ("img", "rct")
+
     def __init__(self, x:int, y:int):
-        self.img = pg.transform.rotozoom(pg.image.load(f"fig/glayringo.png"), 0, 0.1)
+        self.img = cache.image("fig/glayringo.png", scale=0.1)
         self.rct = self.img.get_rect()
         self.rct.right = x
         self.rct.bottom = y
@@ -404,164 +727,540 @@ class ClearObj:
 
 class Thorn:
     """
-    とげに関するクラス
+    とげ1本分の画像と当たり判定用のマスクを向きごとに持つクラス（並べて置くのはThornStrip）
     """
-    img_upper = pg.transform.rotozoom(pg.image.load("fig/thorn.png"), 0, 0.5)     # 上向きのとげ画像
-    img_left = pg.transform.rotozoom(pg.image.load("fig/thorn.png"), -90, 0.5)    # 左向きのとげ画像
-    img_under = pg.transform.rotozoom(pg.image.load("fig/thorn.png"), -180, 0.5)  # 下向きのとげ画像
-    img_right = pg.transform.rotozoom(pg.image.load("fig/thorn.png"), -270, 0.5)  # 右向きのとげ画像
+    img_upper: pg.Surface | None = None  # 上向きのとげ画像（load_images()で読み込む）
+    img_left: pg.Surface | None = None  # 左向きのとげ画像
+    img_under: pg.Surface | None = None  # 下向きのとげ画像
+    img_right: pg.Surface | None = None  # 右向きのとげ画像
+    masks: dict[str, pg.mask.Mask] = {}  # 向き→当たり判定用のマスク
 
-    def __init__(self, xy: tuple[int, int], img: pg.Surface):
+    @classmethod
+    def load_images(cls):
         """
-        とげを初期化する
-        引数 xy: とげの表示位置
+        とげの画像を読み込む（読み込み済みなら何もしない）
         """
-        self.img = img
-        self.rct = self.img.get_rect()
-        self.rct.center = xy
+        if cls.img_upper is not None:
+            return
+        cls.img_upper = cache.image("fig/thorn.png", angle=0, scale=0.5)
+        cls.img_left = cache.image("fig/thorn.png", angle=-90, scale=0.5)
+        cls.img_under = cache.image("fig/thorn.png", angle=-180, scale=0.5)
+        cls.img_right = cache.image("fig/thorn.png", angle=-270, scale=0.5)
+        cls.masks = {direction: cache.mask("fig/thorn.png", angle=angle, scale=0.5)
+                     for direction, angle in (("upper", 0), ("left", -90), ("under", -180), ("right", -270))}
+
 
-    def update(self, screen: pg.Surface):
+class ThornStrip:
+    """
+    一定の間隔で並んだとげの列を1つの帯として扱うクラス
+    当たり判定は帯のRect1つ，描画は並べ済みの画像1枚で行う
+    """
+    __slots__ = ("rct", "img", "mask")
+
+    def __init__(self, xy: tuple[int, int], count: int, direction: str, pitch: int = 20):
         """
-        とげを画面に表示する
-        引数 screen: 画面Surface
+        とげの列を初期化する
+        引数1 xy：最初のとげの中心座標
+        引数2 count：とげの本数
+        引数3 direction：とげの向き（"upper"，"under"，"left"，"right"のいずれか）
+        引数4 pitch：となりのとげの中心どうしの間隔[px]（画像の大きさとは別．画像より狭ければ重ねて並べる）
         """
-        screen.blit(self.img, self.rct)
+        Thorn.load_images()
+        tile = getattr(Thorn, f"img_{direction}")
+        w, h = tile.get_size()
+        first = tile.get_rect(center=xy)
+        if direction in ("upper", "under"):  # 横に並べる
+            self.rct = pg.Rect(first.left, first.top, pitch * (count - 1) + w, h)
+            offsets = [(i * pitch, 0) for i in range(count)]
+        else:  # 縦に並べる
+            self.rct = pg.Rect(first.left, first.top, w, pitch * (count - 1) + h)
+            offsets = [(0, i * pitch) for i in range(count)]
+        self.img = pg.Surface(self.rct.size, pg.SRCALPHA)
+        self.img.blits([(tile, pos) for pos in offsets])
+        if pg.display.get_surface() is not None:
+            self.img = self.img.convert_alpha()
+        self.mask = pg.mask.Mask(self.rct.size)  # とげ1本分のマスクを画像と同じように並べる
+        for pos in offsets:
+            self.mask.draw(Thorn.masks[direction], pos)
 
-def main():
-    pg.display.set_caption("グラビティだよ！こうかとん")
-    screen = pg.display.set_mode((WIDTH, HEIGHT))    
-    bg_img = pg.image.load("fig/pg_bg.jpg")
-
-    gravity_manager = Gravity()
-    bird = Bird((300, 200), gravity_manager)
-    stage = Stege()
-    stage.setup_door(bird)
-    #cringo = ClearObj(WIDTH, HEIGHT)
-    isgravity = 0
-    # enemies1 = [
-    #     Enemy(400, 15, 2),
-    #     Enemy(400, 138, 2),
-    #     Enemy(400, 266, 2),
-    #     Enemy(400, 394, 2),
-    #     Enemy(400, 522, 2)
-    # ]
-    # enemies2 = [
-    #     Enemy(700, 15, -2),
-    #     Enemy(700, 138, -2),
-    #     Enemy(700, 266, -2),
-    #     Enemy(700, 394, -2),
-    #     Enemy(700, 522, -2)
-    # ]
-
-    #explosionリスト初期化
-    explosions = []
-
-    #とげのリストを初期化（位置を指定する）
-    thorn_upper_positions = []
-    thorn_under_positions = []
-    for i in range(60):
-        thorn_upper_position = (i*20+10, 630)
-        thorn_upper_positions.append(thorn_upper_position)
-        thorn_under_position = (i*20+10, 20)
-        thorn_under_positions.append(thorn_under_position)  # 上向きのとげの位置をリストに格納  # 位置を指定して上向きのとげを生成
-    thorns_upper = [Thorn(pos, Thorn.img_upper) for pos in thorn_upper_positions]
-    thorns_under = [Thorn(pos, Thorn.img_under) for pos in thorn_under_positions]
-    thorn_right_positions = []  # 右向きのとげの位置をリストに格納
-    thorns_right = [Thorn(pos, Thorn.img_right) for pos in thorn_right_positions]  # 位置を指定して右向きのとげを生成
-    thorn_left_positions = []  # 左向きのとげの位置をリストに格納
-    thorns_left = [Thorn(pos, Thorn.img_left) for pos in thorn_left_positions]  # 位置を指定して左向きのとげを生成
-
-              
-    clock = pg.time.Clock()
-    
-    tmr = 0
-    while True:
-        if stage.hit_stage(bird):
-            pass #これをするとこうかとんが振動しなくなる
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                return
-            if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
-                #ジャンプの処理
-
-                if bird.gravity_maneger.flag == False:  # 地面にいるときだけジャンプ
-                    bird.vy = bird.gravity_maneger.jump()
-                    bird.gravity_maneger.flag = True
-            if event.type == pg.KEYDOWN and event.key == pg.K_g:
-                gravity_manager.reverse_gravity(bird)
-                bird.g_switch = not bird.g_switch
-            # if event.type == pg.KEYDOWN and event.key == pg.K_g and isgravity == 1:
-            #     isgravity = 1 - isgravity
-        screen.blit(bg_img, [0, 0])
-        stage.draw(screen)
-        enemies1 = stage.apple1
-        enemies2 = stage.apple2
-
-        # if stage.hit_stage(bird):
-        #     pass #これをするとこうかとんが振動しなくなる
-        #goal処理
+    def hits(self, rct: pg.Rect, mask: pg.mask.Mask) -> bool:
+        """
+        とげの列が物体と画素単位で重なっているかを判定する（先にRectで判定する）
+        引数1 rct：判定する物体のRect
+        引数2 mask：rctの左上に置いた物体のマスク
+        戻り値：重なっていればTrue
+        """
+        return (self.rct.colliderect(rct)
+                and mask.overlap(self.mask, (self.rct.x - rct.x, self.rct.y - rct.y)) is not None)
+
+    def draw(self, screen: pg.Surface, offset: tuple[int, int] = (0, 0)):
+        """
+        とげの列を画面に表示する
+        引数1 screen: 画面Surface
+        引数2 offset: ワールド座標から描画先の座標へのずれ
+        """
+        screen.blit(self.img, self.rct.move(offset))
+
+
+class KeyState:
+    """
+    pg.key.get_pressed()の代わりに使う押下キーの状態
+    """
+    __slots__ = ("keys",)
+
+    def __init__(self, keys=()):
+        """
+        引数 keys：押されているキーの集まり
+        """
+        self.keys = frozenset(keys)
+
+    def __getitem__(self, key: int) -> bool:
+        return key in self.keys
+
+
+class Game:
+    """
+    1回のプレイに必要なオブジェクトと1フレーム分のゲーム処理をまとめたクラス
+    描画とは切り離されているので，画面なしでも進められる
+    """
+    def __init__(self, levels: list[dict] | None = None, preload: bool = False):
+        """
+        引数1 levels：遊ぶステージのデータのリスト（省略時はステージデータファイルから読み込む）
+        引数2 preload：次のステージを別スレッドで用意しておくか（画面ありで遊ぶときに使う）
+        """
+        self.gravity_manager = Gravity()
+        self.bird = Bird((300, 200), self.gravity_manager)
+        self.stage = Stege(levels, preload)
+        self.stage.setup_door(self.bird)
+        self.camera = Camera((WIDTH, HEIGHT), self.stage.world.size)
+        self.tmr = 0
+        self.profiler: FrameProfiler | None = None  # 計測中のみ設定する
+
+    def handle_event(self, event: pg.event.Event):
+        """
+        ジャンプと重力反転のキー入力を処理する
+        引数 event：pygameのイベント
+        """
+        bird = self.bird
+        if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
+            #ジャンプの処理
+            if bird.gravity_maneger.flag == False:  # 地面にいるときだけジャンプ
+                bird.vy = bird.gravity_maneger.jump()
+                bird.gravity_maneger.flag = True
+        if event.type == pg.KEYDOWN and event.key == pg.K_g:
+            self.gravity_manager.reverse_gravity(bird)
+            bird.g_switch = not bird.g_switch
+
+    def snapshot(self) -> tuple:
+        """
+        ゲームの進行に関わる状態を保存する（描画だけに使う状態は含まない）
+        戻り値：restore()に渡す状態のタプル
+        """
+        bird, g, stage = self.bird, self.gravity_manager, self.stage
+        return (bird.rct.topleft, bird.vy, bird.dire, bird.reversing, bird.g_switch,
+                g.gravity, g.jump_power, g.flag,
+                stage.current_stage_index, stage.goal, stage.apples.top.copy(), self.tmr)
+
+    def restore(self, state: tuple):
+        """
+        snapshot()で保存した状態に戻す
+        引数 state：snapshot()の戻り値
+        """
+        bird, g, stage = self.bird, self.gravity_manager, self.stage
+        (topleft, bird.vy, bird.dire, bird.reversing, bird.g_switch,
+         g.gravity, g.jump_power, g.flag, index, goal, tops, self.tmr) = state
+        if index != stage.current_stage_index:
+            stage.load_stage(index)
+            bird.bounds = stage.world
+        stage.goal = goal
+        bird.rct.topleft = topleft
+        bird.prev_rct.topleft = topleft
+        stage.apples.top[:] = tops
+        stage.apples.prev_top[:] = tops
+
+    def step(self, key_lst, events=()) -> str | None:
+        """
+        ゲームを1フレーム進める
+        引数1 key_lst：押下キーの真理値リスト
+        引数2 events：このフレームのイベントのリスト
+        戻り値：ゴールしたら"goal"，りんごに当たったら"enemy"，とげに当たったら"thorn"，それ以外はNone
+        """
+        bird, stage, prof = self.bird, self.stage, self.profiler
+        stage.hit_stage(bird)  # 先に判定するとこうかとんが振動しなくなる
+        if prof is not None:
+            prof.mark("hit_stage")
+        for event in events:
+            self.handle_event(event)
+        stage.update()
         if stage.goal:
-            screen.fill((255, 255, 255))
-            font = pg.font.Font(None, 100)
-            text = font.render("Goal", True, (0, 0, 0))
-            text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            screen.blit(text, text_rect)
-            pg.display.update()  # ゴールメッセージを画面に反映
-            pg.time.wait(2000)  # 「Goal」を2秒間表示
-            return  # ゲーム終了
-                
-            
-            
-
-        for enemy in enemies1:
-            if bird.rct.colliderect(enemy.rct):
-                # ゲームオーバー時に，こうかとん画像を切り替え，1秒間表示させる
-                bird.change_img(8, screen)
-                pg.display.update()
-                time.sleep(1)
-                return
-            
-        for enemy in enemies2:
-            if bird.rct.colliderect(enemy.rct):
-                # ゲームオーバー時に，こうかとん画像を切り替え，1秒間表示させる
-                bird.change_img(8, screen)
-                pg.display.update()
-                time.sleep(1)
-                return
-            
-        # if bird.rct.colliderect(cringo.rct):
-        #         bird.change_img(6, screen)
-        #         pg.display.update()
-        #         time.sleep(1)
-        #         return
-
-        key_lst = pg.key.get_pressed()
-        bird.update(key_lst, screen)
-        for thorn in thorns_upper + thorns_right + thorns_under + thorns_left:
-            thorn.update(screen)
-            if bird.rct.colliderect(thorn.rct):  #とげにぶつかったら
-                return  # ゲーム終了
+            return "goal"
+        if stage.apples.hits(bird.rct, bird.mask):
+            return "enemy"
+        bird.update(key_lst)
+        hit = stage.sweep(bird)  # 速く動いたステップは道のりの途中の床・とげ・りんごも調べる
+        if hit is not None and hit[1] != "platform":
+            return hit[1]
+        for thorn in stage.thorn_grid.query(bird.rct):
+            if thorn.hits(bird.rct, bird.mask):  #とげにぶつかったら
+                return "thorn"
+        if prof is not None:
+            prof.mark("bird")
+        stage.apples.update()
+        if prof is not None:
+            prof.mark("enemies")
+        self.tmr += 1
+        return None
 
-        #enemy1.update(screen)
-        #cringo.update(screen)
-        
-        for enemy in enemies1:
-            enemy.update(screen)
-        for enemy in enemies2:
-            enemy.update(screen)
+    def advance(self, key_lst, ticks: int) -> tuple[str | None, int]:
+        """
+        同じキーを押したまま（イベントなしで）最大ticksステップ進める
+        結果と状態はstep()をticks回繰り返した場合と同じになる
+        引数1 key_lst：押下キーの真理値リスト
+        引数2 ticks：進める最大ステップ数
+        戻り値：step()と同じ結果と進めたステップ数のタプル（結果が出たらそこで止まる）
+        """
+        done = 0
+        while done < ticks:
+            done += self.coast(key_lst, ticks - done)
+            if done == ticks:
+                break
+            result = self.step(key_lst)  # ドア・とげ・りんごが関わるステップはいつもの処理で進める
+            done += 1
+            if result is not None:
+                return result, done
+        return None, done
+
+    def coast(self, key_lst, ticks: int) -> int:
+        """
+        ドア・とげ・りんごに触れない間だけ，step()を簡略化した処理でまとめて進める
+        こうかとんの周り（COAST_MARGINだけ広げた範囲）の床ととげを一度だけ探しておき，
+        その範囲を出るまでは空間ハッシュを引かずに判定する
+        引数1 key_lst：押下キーの真理値リスト
+        引数2 ticks：進める最大ステップ数
+        戻り値：進めたステップ数（次のステップでドア・とげ・りんごとRectが重なるならそこで止まる）
+        """
+        bird, g, stage = self.bird, self.gravity_manager, self.stage
+        apples, door, rct = stage.apples, stage.door_rect, bird.rct
+        box = None
+        platforms: list[pg.Rect] = []
+        thorns: list[pg.Rect] = []
+
+        def near(rct: pg.Rect) -> bool:
+            # 範囲を出ていたら候補を探し直す（りんごの列に近づいたらFalse）
+            nonlocal box, platforms, thorns
+            if box is not None and box.contains(rct):
+                return True
+            box = rct.inflate(COAST_MARGIN * 2, COAST_MARGIN * 2)
+            if ((apples.left < box.right) & (apples.right > box.left)).any():
+                return False
+            platforms = stage.platform_grid.query(box)
+            thorns = [thorn.rct for thorn in stage.thorn_grid.query(box)]
+            return True
+
+        done = 0
+        while done < ticks and near(rct):
+            saved = (rct.topleft, bird.prev_rct.topleft, bird.vy, bird.dire, bird.img, g.flag)
+            i = rct.collidelist(platforms)  # Stege.hit_stage()と同じく最初に当たった床に乗せる
+            if i != -1:
+                if bird.g_switch:
+                    rct.top = platforms[i].bottom
+                else:
+                    rct.bottom = platforms[i].top
+                bird.vy = 0
+            if door is not None and rct.colliderect(door):
+                rct.topleft, bird.prev_rct.topleft, bird.vy, bird.dire, bird.img, g.flag = saved
+                break
+            g.flag = i == -1
+            bird.update(key_lst)
+            # 床をすり抜けるほど速く動いたステップはstep()のsweep()に任せる
+            if not near(rct) or abs(rct.y - bird.prev_rct.y) > rct.height or rct.collidelist(thorns) != -1:
+                rct.topleft, bird.prev_rct.topleft, bird.vy, bird.dire, bird.img, g.flag = saved
+                break
+            stage.update()
+            done += 1
+        apples.advance(done)  # りんごは進めたステップ数の分だけまとめて動かす
+        self.tmr += done
+        return done
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0):
+        """
+        現在の状態を画面に描画する
+        引数1 screen：画面Surface
+        引数2 alpha：動くものを直前のステップとの間のどこに描くか（0.0～1.0）
+        """
+        screen.blit(self.view(alpha), (0, 0))
+        self.draw_dynamic(screen, alpha)
+
+    def view(self, alpha: float = 1.0) -> pg.Surface:
+        """
+        カメラをこうかとんに合わせて動かし，映る範囲の動かないものの画像を返す
+        引数 alpha：こうかとんを直前のステップとの間のどこに描くか（0.0～1.0）
+        戻り値：画面と同じ大きさのSurface（カメラが動かなければ前回と同じ内容）
+        """
+        bird, camera = self.bird, self.camera
+        camera.set_world(self.stage.world.size)
+        x, y = lerp_pos(bird.prev_rct, bird.rct, alpha)
+        camera.follow((x + bird.rct.width / 2, y + bird.rct.height / 2))
+        return self.stage.static_layer(camera)
 
+    def draw_dynamic(self, screen: pg.Surface, alpha: float = 1.0) -> list[pg.Rect]:
+        """
+        こうかとん・りんご・文字など，フレームごとに変わるものを描画する
+        view()でカメラを動かした後に呼ぶ
+        引数1 screen：描画先のSurface
+        引数2 alpha：動くものを直前のステップとの間のどこに描くか（0.0～1.0）
+        戻り値：描画した範囲のリスト
+        """
+        camera = self.camera
+        rects = self.stage.draw_message(screen)
+        rects.append(self.bird.draw(screen, alpha, camera.offset))
+        rects.extend(self.stage.apples.draw(screen, alpha, camera.view))
+        return rects
 
-        explosions = [explosion for explosion in explosions if explosion.life > 0]
-        for explosion in explosions:
-            explosion.update(screen)
-            
+
+def keydown_events(keys) -> list[pg.event.Event]:
+    """
+    キーの番号のリストからKEYDOWNイベントのリストを作る
+    引数 keys：キーの番号のリスト
+    戻り値：イベントのリスト
+    """
+    return [pg.event.Event(pg.KEYDOWN, key=k) for k in keys]
+
+
+def run_headless(script, max_frames: int | None = None,
+                 levels: list[dict] | None = None, max_step: int = 1) -> tuple[str | None, int]:
+    """
+    画面を描画せず，時間待ちもせずにゲームを進める
+    引数1 script：フレームごとの（押下キーの集まり, KEYDOWNするキーのリスト）を返す反復可能オブジェクト
+    引数2 max_frames：進める最大フレーム数（Noneならscriptが尽きるまで）
+    引数3 levels：遊ぶステージのデータのリスト（省略時はステージデータファイルから読み込む）
+    引数4 max_step：同じ入力が続くフレームをまとめて進める最大数（Game.advance()を使う．1なら1フレームずつ）
+    戻り値：ゲームの結果（step()の戻り値）と進めたフレーム数のタプル
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pg.init()
+    game = Game(levels)
+    result = None
+    frames = 0
+    script = iter(script)
+    step_input = next(script, None)
+    while step_input is not None:
+        if max_frames is not None and frames >= max_frames:
+            break
+        pressed, keydowns = step_input
+        step_input = next(script, None)
+        limit = max_step if max_frames is None else min(max_step, max_frames - frames)
+        if keydowns or limit <= 1:
+            result = game.step(KeyState(pressed), keydown_events(keydowns))
+            frames += 1
+        else:
+            count = 1  # 同じキーを押したままでイベントのないフレームの数
+            while count < limit and step_input is not None and not step_input[1] and set(step_input[0]) == set(pressed):
+                count += 1
+                step_input = next(script, None)
+            result, n = game.advance(KeyState(pressed), count)
+            frames += n
+        if result is not None:
+            break
+    return result, frames
+
+
+def load_images():
+    """
+    ゲームで使う画像をまとめて読み込む
+    画面を作った後に呼ぶと，画面のピクセル形式に変換された状態でキャッシュされる
+    """
+    Bird.load_images()
+    Thorn.load_images()
+    cache.image("fig/8.png", scale=0.9)  # ゲームオーバー時の画像
+    for s in EXPLOSION_SCALES:  # 爆発の粒子
+        cache.image("fig/explosion.gif", scale=s)
+    cache.image("fig/pg_bg.jpg")
+
+
+def play_effect(screen: pg.Surface, particles: ParticleSystem, seconds: float, offset: tuple[int, int] = (0, 0)):
+    """
+    今の画面を背景にして，粒子が飛び散る様子をseconds秒間表示する（ゲームが終わるときに使う）
+    引数1 screen：画面Surface
+    引数2 particles：動かす粒子
+    引数3 seconds：表示する時間[秒]
+    引数4 offset：ワールド座標から画面上の座標へのずれ（Camera.offset）
+    """
+    still = screen.copy()
+    scheduler = FrameScheduler(PHYSICS_FPS)
+    for _ in range(round(seconds * PHYSICS_FPS)):
+        pg.event.pump()
+        screen.blit(still, (0, 0))
+        particles.update()
+        particles.draw(screen, 1.0, offset)
         pg.display.update()
-        tmr += 1
-        clock.tick(50)
+        scheduler.wait()
+
+
+def main(profile_out: str | None = None, record: str | None = None, replay: str | None = None,
+         max_frames: int | None = None, levels: list[dict] | None = None, fps: float = MAX_FPS):
+    """
+    ゲームを実行する
+    引数1 profile_out：処理時間をフレームごとに書き出すCSVファイルのパス（F3キーで表示を切り替え）
+    引数2 record：入力を記録するファイルのパス
+    引数3 replay：再生する入力記録ファイルのパス（指定するとキーボードの代わりに使う）
+    引数4 max_frames：指定したフレーム数を描画したら終了する（起動時間の計測用）
+    引数5 levels：遊ぶステージのデータのリスト（省略時はステージデータファイルから読み込む）
+    引数6 fps：描画の目標フレームレート（間に合わないときは描画だけを飛ばす）
+    """
+    pg.display.set_caption("グラビティだよ！こうかとん")
+    screen = pg.display.set_mode((WIDTH, HEIGHT))
+    load_images()
+
+    game = Game(levels, preload=True)
+    bird = game.bird
+    scheduler = FrameScheduler(fps)
+    renderer = DirtyRenderer(screen)
+    prof = FrameProfiler(profile_out)
+    recorder = InputRecorder() if record else None
+    replay_steps = iter(InputReplayer(replay)) if replay else None
+    particles = ParticleSystem()
+    explosion = particles.add_kind([cache.image("fig/explosion.gif", scale=s) for s in EXPLOSION_SCALES])
+    spark = particles.add_kind(dot_frames((120, 60, 255), 5))  # 重力反転
+    confetti = particles.add_kind(dot_frames((255, 200, 0), 6))  # ステージクリア
+
+    def fall() -> float:  # 粒子にかける重力（こうかとんと同じ向き）
+        return 0.15 if game.gravity_manager.gravity > 0 else -0.15
+
+    # 物理演算は1/PHYSICS_FPS秒ごとに固定で進め，描画はステップ間を補間する
+    step_time = 1 / PHYSICS_FPS
+    accumulator = 0.0
+    pending_events = []  # まだステップに渡していないイベント
+    frames = 0
+    shown_view = None  # 画面に映しているカメラの位置
+    prev_time = time.perf_counter()
+    try:
+        while True:
+            now = time.perf_counter()
+            accumulator += min(now - prev_time, MAX_FRAME_TIME)
+            prev_time = now
+            scheduler.begin_frame()
+            if prof.enabled:
+                prof.begin_frame()
+
+            for event in pg.event.get():
+                if event.type == pg.QUIT:
+                    return
+                if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                    prof.toggle()
+                    prof.begin_frame()
+                pending_events.append(event)
+            game.profiler = prof if prof.enabled else None
+            if prof.enabled:
+                prof.mark("events")
+            result = None
+            while accumulator >= step_time:
+                if replay_steps is not None:
+                    step_input = next(replay_steps, None)
+                    if step_input is None:  # 記録の最後まで再生した
+                        return
+                    key_lst, events = KeyState(step_input[0]), keydown_events(step_input[1])
+                else:
+                    key_lst, events = pg.key.get_pressed(), pending_events
+                if recorder is not None:
+                    recorder.record(key_lst, events)
+                flipped, index = bird.g_switch, game.stage.current_stage_index
+                result = game.step(key_lst, events)
+                particles.update()
+                if bird.g_switch != flipped:
+                    particles.burst(bird.rct.center, FLIP_PARTICLES, spark, (1, 4), (15, 30))
+                if game.stage.current_stage_index != index:
+                    particles.burst(bird.rct.center, CLEAR_PARTICLES, confetti, (2, 8), (30, 60), fall())
+                pending_events = []
+                accumulator -= step_time
+                if result is not None:
+                    break
+
+            #goal処理
+            if result == "goal":
+                screen.fill((255, 255, 255))
+                text = texts.render("Goal", 100, (0, 0, 0))
+                text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
+                screen.blit(text, text_rect)
+                particles.clear()  # ここからは画面の座標で飛ばす
+                particles.burst(text_rect.center, CLEAR_PARTICLES, confetti, (2, 10), (40, 90), 0.15)
+                play_effect(screen, particles, 2.0)  # 「Goal」を2秒間表示
+                return  # ゲーム終了
+
+            if result is None and not scheduler.should_draw():  # 遅れているので描画だけ飛ばす
+                scheduler.wait()
+                if prof.enabled:
+                    prof.mark("wait")
+                    prof.end_frame()
+                continue
+            alpha = min(accumulator / step_time, 1.0)
+            layer = game.view(alpha)
+            view = game.camera.view.topleft
+            if layer is not renderer.background or view != shown_view:  # ステージが変わるかカメラが動いたら背景を差し替える
+                renderer.set_background(layer)
+                shown_view = view
+            renderer.restore()
+            rects = game.draw_dynamic(screen, alpha)
+            if prof.enabled:
+                rects.extend(prof.draw(screen, [scheduler.summary()]))
+                prof.mark("draw")
+            if result in ("enemy", "thorn"):
+                if result == "enemy":  # ゲームオーバー時に，こうかとん画像を切り替える
+                    bird.change_img(8, screen, game.camera.offset)
+                # 爆発を1秒間表示させてゲーム終了
+                particles.burst(bird.rct.center, EXPLOSION_PARTICLES, explosion, (1, 6), (20, 50), fall())
+                play_effect(screen, particles, 1.0, game.camera.offset)
+                return
+
+            rects.extend(particles.draw(screen, alpha, game.camera.offset))
+            renderer.present(rects)
+            scheduler.end_draw()
+            frames += 1
+            if frames == 1:  # 起動から最初のフレームを表示するまでの時間
+                prof.startup_ms = (time.perf_counter() - STARTUP_T0) * 1000
+            if frames == max_frames:
+                return
+            if prof.enabled:
+                prof.mark("display")
+            scheduler.wait()
+            if prof.enabled:
+                prof.mark("wait")
+                prof.end_frame()
+    finally:
+        if profile_out is not None:  # 計測中だけ，描画を飛ばした数を最後に報告する（普段はF3の表示で見る）
+            print(scheduler.summary())
+        prof.close()
+        Stege.shutdown_preloader()
+        if recorder is not None:
+            recorder.save(record)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="グラビティこうかとん")
+    parser.add_argument("--headless", action="store_true",
+                        help="画面なし・待ち時間なしで進め，速度を表示する")
+    parser.add_argument("--frames", type=int, help="--headlessで進める最大フレーム数")
+    parser.add_argument("--max-step", type=int, default=64,
+                        help="--headlessで同じ入力が続くフレームをまとめて進める最大数（1なら1フレームずつ）")
+    parser.add_argument("--profile", metavar="CSV", help="フレームごとの処理時間をCSVファイルに書き出す")
+    parser.add_argument("--record", metavar="FILE", help="入力をファイルに記録する")
+    parser.add_argument("--replay", metavar="FILE", help="記録した入力を再生する")
+    parser.add_argument("--levels", metavar="FILE", help="ステージデータファイル（stagegen.pyで作ったものなど）")
+    parser.add_argument("--fps", type=float, default=MAX_FPS, help="描画の目標フレームレート")
+    args = parser.parse_args()
+    levels = load_levels(args.levels) if args.levels else None
+    if args.headless:
+        if args.replay:
+            script = InputReplayer(args.replay)
+        else:
+            script = iter(lambda: ((), ()), None)  # 何も押さない
+            args.frames = args.frames or 10000
+        start = time.perf_counter()
+        result, n = run_headless(script, args.frames, levels, args.max_step)
+        elapsed = time.perf_counter() - start
+        print(f"result={result} frames={n} fps={n / elapsed:.0f}")
+        sys.exit()
     pg.init()
-    main()
+    main(args.profile, args.record, args.replay, levels=levels, fps=args.fps)
     pg.quit()
-    sys.exit()
\ No newline at end of file
+    sys.exit()
@@ -0,0 +1,198 @@
+"""
+画像アセットと文字のキャッシュ
+ファイルは一度だけ読み込み，拡大縮小・回転・反転したバリエーションもキーごとに保持する
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pygame as pg
+
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024  # キャッシュに保持する画像の合計サイズの上限
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # 相対パスの基準（作業ディレクトリには依存しない）
+
+
+def surface_bytes(surf: pg.Surface) -> int:
+    """
+    Surfaceが使用するおおよそのメモリ量を返す
+    引数 surf：対象のSurface
+    戻り値：バイト数
+    """
+    w, h = surf.get_size()
+    return w * h * surf.get_bytesize()
+
+
+class AssetCache:
+    """
+    画像の読み込みと変形結果をまとめて管理するクラス
+    同じキーで要求された画像は同じSurfaceを共有する
+    次のステージを用意するスレッドからも使うので，読み書きはロックして行う
+    """
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES):
+        """
+        引数 max_bytes：保持する画像の合計サイズの上限（超えたら古いものから捨てる）
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[tuple, tuple[pg.Surface, bool]] = OrderedDict()
+        self._masks: dict[tuple, pg.mask.Mask] = {}  # 当たり判定用のマスク（画像と同じキー）
+        self._lock = threading.RLock()  # image()は自分自身を呼ぶのでRLock
+
+    def _convert(self, surf: pg.Surface) -> tuple[pg.Surface, bool]:
+        """
+        画面が作られていれば画面のピクセル形式に変換する
+        引数 surf：変換するSurface
+        戻り値：Surfaceと変換済みかどうかのタプル
+        """
+        if pg.display.get_surface() is None:
+            return surf, False
+        if surf.get_flags() & pg.SRCALPHA:
+            return surf.convert_alpha(), True
+        return surf.convert(), True
+
+    def _store(self, key: tuple, surf: pg.Surface, converted: bool):
+        """
+        キャッシュに登録し，上限を超えた分を古い順に捨てる
+        """
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= surface_bytes(old[0])
+        self._entries[key] = (surf, converted)
+        self.total_bytes += surface_bytes(surf)
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.total_bytes -= surface_bytes(evicted)
+
+    def image(self, path: str, angle: float = 0, scale: float = 1.0,
+              flip_x: bool = False, flip_y: bool = False,
+              size: tuple[int, int] | None = None) -> pg.Surface:
+        """
+        変形済みの画像を返す（なければ作ってキャッシュする）
+        引数1 path：画像ファイルのパス（相対パスはBASE_DIRからの位置）
+        引数2 angle：回転角度（rotozoomと同じ向き）
+        引数3 scale：拡大率
+        引数4 flip_x：左右反転するか
+        引数5 flip_y：上下反転するか
+        引数6 size：指定した場合はこの大きさに拡大縮小する
+        戻り値：画像Surface
+        """
+        with self._lock:
+            return self._image(path, angle, scale, flip_x, flip_y, size)
+
+    def _image(self, path: str, angle: float, scale: float, flip_x: bool, flip_y: bool,
+               size: tuple[int, int] | None) -> pg.Surface:
+        key = (path, angle, scale, flip_x, flip_y, size)
+        entry = self._entries.get(key)
+        if entry is not None:
+            surf, converted = entry
+            if not converted:
+                surf, converted = self._convert(surf)
+                if converted:
+                    self._store(key, surf, converted)
+            self._entries.move_to_end(key)
+            return surf
+
+        if key == (path, 0, 1.0, False, False, None):
+            surf = pg.image.load(os.path.join(BASE_DIR, path))
+        else:
+            surf = self.image(path)
+            if angle != 0 or scale != 1.0:
+                surf = pg.transform.rotozoom(surf, angle, scale)
+            if flip_x or flip_y:
+                surf = pg.transform.flip(surf, flip_x, flip_y)
+            if size is not None:
+                surf = pg.transform.scale(surf, size)
+        surf, converted = self._convert(surf)
+        self._store(key, surf, converted)
+        return surf
+
+    def mask(self, path: str, angle: float = 0, scale: float = 1.0,
+             flip_x: bool = False, flip_y: bool = False,
+             size: tuple[int, int] | None = None) -> pg.mask.Mask:
+        """
+        image()と同じ引数の画像の，不透明な画素を表すマスクを返す（なければ作ってキャッシュする）
+        引数はimage()と同じ
+        戻り値：画素単位の当たり判定に使うMask
+        """
+        key = (path, angle, scale, flip_x, flip_y, size)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is None:
+                mask = self._masks[key] = pg.mask.from_surface(self._image(*key))
+            return mask
+
+    def clear(self):
+        """
+        キャッシュを空にする
+        """
+        with self._lock:
+            self._entries.clear()
+            self._masks.clear()
+            self.total_bytes = 0
+
+
+cache = AssetCache()  # ゲーム全体で共有するキャッシュ
+
+
+MAX_TEXTS = 256  # キャッシュに保持する文字画像の数の上限
+
+
+class TextCache:
+    """
+    フォントと文字を描画したSurfaceを使い回すクラス
+    同じ文字列・大きさ・色の文字は一度だけ描画する
+    """
+    def __init__(self, max_texts: int = MAX_TEXTS):
+        """
+        引数 max_texts：保持する文字画像の数の上限（超えたら古いものから捨てる）
+        """
+        self.max_texts = max_texts
+        self._fonts: dict[tuple[str | None, int], pg.font.Font] = {}
+        self._texts: OrderedDict[tuple, pg.Surface] = OrderedDict()
+
+    def font(self, size: int, name: str | None = None) -> pg.font.Font:
+        """
+        フォントを返す（なければ作る）
+        引数1 size：文字の大きさ
+        引数2 name：フォントファイルのパス（Noneならpygame標準のフォント）
+        戻り値：Fontオブジェクト
+        """
+        key = (name, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = pg.font.Font(name, size)
+        return font
+
+    def render(self, text: str, size: int, color: tuple[int, int, int],
+               name: str | None = None) -> pg.Surface:
+        """
+        文字を描画したSurfaceを返す（なければ描画してキャッシュする）
+        引数1 text：文字列
+        引数2 size：文字の大きさ
+        引数3 color：文字の色
+        引数4 name：フォントファイルのパス（Noneならpygame標準のフォント）
+        戻り値：文字を描画したSurface
+        """
+        key = (text, size, tuple(color), name)
+        surf = self._texts.get(key)
+        if surf is not None:
+            self._texts.move_to_end(key)
+            return surf
+        surf = self.font(size, name).render(text, True, color)
+        if pg.display.get_surface() is not None:
+            surf = surf.convert_alpha()
+        self._texts[key] = surf
+        if len(self._texts) > self.max_texts:
+            self._texts.popitem(last=False)
+        return surf
+
+    def clear(self):
+        """
+        キャッシュを空にする
+        """
+        self._fonts.clear()
+        self._texts.clear()
+
+
+texts = TextCache()  # ゲーム全体で共有する文字のキャッシュ
@@ -0,0 +1,231 @@
+"""
+ゲームの重い処理の実行時間を画面なしで計測するベンチマーク
+例：python benchmark.py --out result.json
+    python benchmark.py --baseline result.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import numpy as np
+import pygame as pg
+
+import Gravity_koukaton as game_mod
+from levels import load_levels
+
+
+STRESS_SCALES = (10, 100)  # ストレステスト用ステージの物量の倍率
+SAFE_LEFT = 100  # ストレステストでりんごやとげを置かない左端の幅（こうかとんの初期位置の周り）
+ITERATIONS = 500  # 1項目あたりの計測回数
+STARTUP_RUNS = 5  # 起動時間を計測する回数
+
+# 新しいPythonプロセスで，モジュールの読み込みと最初のフレームの表示までの時間[µs]を測るスクリプト
+STARTUP_SCRIPT = """
+import sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {path!r})
+import Gravity_koukaton as g
+t1 = time.perf_counter()
+import pygame as pg
+pg.init()
+g.main(max_frames=1)
+t2 = time.perf_counter()
+print((t1 - t0) * 1e6, (t2 - t0) * 1e6)
+"""
+
+
+def stress_level(level: dict, scale: int, seed: int = 0) -> dict:
+    """
+    既存のステージをもとに床・りんご・とげをscale倍に増やしたステージを作る
+    引数1 level：もとにするステージのデータ
+    引数2 scale：物量の倍率
+    引数3 seed：乱数のシード
+    戻り値：ステージのデータ
+    """
+    rng = random.Random(seed)
+    w, h = game_mod.WIDTH, game_mod.HEIGHT
+    platforms = list(level["platforms"])
+    apples = list(level["apples"])
+    thorns = list(level["thorns"])
+    for _ in range(scale - 1):
+        for _, _, pw, ph in level["platforms"]:
+            platforms.append([rng.randrange(0, w - 20), rng.randrange(60, h - 80), pw, ph])
+        for _, y, vy in level["apples"]:
+            apples.append([rng.randrange(SAFE_LEFT, w - 20), y, vy])
+        for _ in level["thorns"]:
+            xy = [rng.randrange(SAFE_LEFT, w), rng.randrange(60, h - 80)]
+            thorns.append([xy, rng.randrange(2, 8), rng.choice(("upper", "left"))])
+    return dict(level, platforms=platforms, apples=apples, thorns=thorns)
+
+
+def time_calls(func, n: int = ITERATIONS) -> dict:
+    """
+    関数をn回呼び，1回あたりの時間を集計する
+    引数1 func：計測する引数なしの関数
+    引数2 n：呼び出す回数
+    戻り値：平均・中央値・最小・95パーセンタイル[µs]の辞書
+    """
+    samples = []
+    clock = time.perf_counter
+    for _ in range(n):
+        t0 = clock()
+        func()
+        samples.append((clock() - t0) * 1e6)
+    return summarize(samples)
+
+
+def summarize(samples: list[float]) -> dict:
+    """
+    計測値[µs]のリストを集計する
+    引数 samples：計測値のリスト
+    戻り値：平均・中央値・最小・95パーセンタイル[µs]の辞書
+    """
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "mean_us": statistics.fmean(samples),
+        "median_us": samples[n // 2],
+        "min_us": samples[0],
+        "p95_us": samples[int(n * 0.95)],
+    }
+
+
+def bench_level(level: dict, screen: pg.Surface, n: int = ITERATIONS) -> dict:
+    """
+    1つのステージについて各処理の時間を計測する
+    引数1 level：ステージのデータ
+    引数2 screen：描画先のSurface
+    引数3 n：1項目あたりの計測回数
+    戻り値：処理名→集計結果の辞書
+    """
+    idle = game_mod.KeyState()
+    results = {}
+
+    game = game_mod.Game([level])
+    results["Bird.update"] = time_calls(lambda: game.bird.update(idle), n)
+
+    game = game_mod.Game([level])
+    results["Stege.hit_stage"] = time_calls(lambda: game.stage.hit_stage(game.bird), n)
+
+    game = game_mod.Game([level])
+    results["Stege.draw"] = time_calls(lambda: game.stage.draw(screen), n)
+
+    game = game_mod.Game([level])
+    results["Enemies.update"] = time_calls(game.stage.apples.update, n)
+
+    game = game_mod.Game([level])
+    bird, stage = game.bird, game.stage
+
+    def thorn_loop():
+        for thorn in stage.thorn_grid.query(bird.rct):
+            thorn.hits(bird.rct, bird.mask)
+    results["thorn loop"] = time_calls(thorn_loop, n)
+
+    # main()の1フレーム分（ステップ・描画・画面更新）
+    state = {"game": game_mod.Game([level])}
+
+    def frame():
+        game = state["game"]
+        if game.step(idle) is not None:
+            state["game"] = game = game_mod.Game([level])
+        game.draw(screen)
+        pg.display.update()
+    results["frame"] = time_calls(frame, n)
+    return results
+
+
+def bench_startup(runs: int = STARTUP_RUNS) -> dict:
+    """
+    新しいプロセスでゲームを起動し，モジュールの読み込み時間と最初のフレームまでの時間を計測する
+    引数 runs：起動する回数
+    戻り値：処理名→集計結果の辞書
+    """
+    script = STARTUP_SCRIPT.format(path=os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    imports, first_frames = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True,
+                             text=True, check=True).stdout.split()
+        imports.append(float(out[-2]))
+        first_frames.append(float(out[-1]))
+    return {"import": summarize(imports), "first frame": summarize(first_frames)}
+
+
+def run(n: int = ITERATIONS) -> dict:
+    """
+    すべてのステージとストレステスト用ステージを計測する
+    引数 n：1項目あたりの計測回数
+    戻り値：計測結果（JSONにそのまま書き出せる辞書）
+    """
+    pg.init()
+    t0 = time.perf_counter()
+    screen = pg.display.set_mode((game_mod.WIDTH, game_mod.HEIGHT))
+    levels = load_levels()
+    cases = {}
+    for i, level in enumerate(levels):
+        cases[f"stage{i + 1}"] = level
+        for scale in STRESS_SCALES:
+            cases[f"stage{i + 1}x{scale}"] = stress_level(level, scale, seed=i)
+    results = {"startup": bench_startup()}
+    for name, level in cases.items():
+        results[name] = bench_level(level, screen, n)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pygame": pg.version.ver,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "iterations": n,
+            "total_seconds": time.perf_counter() - t0,
+        },
+        "results": results,
+    }
+
+
+def print_report(report: dict, baseline: dict | None = None):
+    """
+    計測結果を表にして表示する（baselineがあれば中央値の比も表示する）
+    引数1 report：run()の戻り値
+    引数2 baseline：比較するrun()の戻り値
+    """
+    for case, items in report["results"].items():
+        print(case)
+        for name, r in items.items():
+            line = f"  {name:<16} median {r['median_us']:9.1f}us  p95 {r['p95_us']:9.1f}us"
+            if baseline is not None:
+                old = baseline["results"].get(case, {}).get(name)
+                if old is not None and old["median_us"] > 0:
+                    line += f"  x{r['median_us'] / old['median_us']:.2f}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="計測結果を書き出すJSONファイル")
+    parser.add_argument("--baseline", help="比較に使う過去の計測結果のJSONファイル")
+    parser.add_argument("-n", type=int, default=ITERATIONS, help="1項目あたりの計測回数")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report = run(args.n)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    pg.quit()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit()
@@ -0,0 +1,58 @@
+"""
+画面より大きいステージを表示するためのカメラ
+ステージ上の座標（ワールド座標）のうち，画面に映す範囲を管理する
+"""
+import pygame as pg
+
+
+CHUNK_SIZE = 512  # 動かないものを描き込んでおく正方形の区画の一辺[px]
+
+
+class Camera:
+    """
+    画面に映すワールド座標の範囲を持ち，追いかける位置が画面の中央に来るように動くクラス
+    ステージの端より外は映さない
+    """
+    __slots__ = ("view", "world")
+
+    def __init__(self, view_size: tuple[int, int], world_size: tuple[int, int]):
+        """
+        引数1 view_size：画面の大きさ
+        引数2 world_size：ステージ全体の大きさ
+        """
+        self.view = pg.Rect((0, 0), view_size)  # 画面に映す範囲（ワールド座標）
+        self.world = pg.Rect((0, 0), world_size)
+
+    def set_world(self, world_size: tuple[int, int]):
+        """
+        ステージの大きさを変える（ステージが切り替わったときに呼ぶ）
+        引数 world_size：ステージ全体の大きさ
+        """
+        if self.world.size != tuple(world_size):
+            self.world.size = world_size
+            self.view.clamp_ip(self.world)
+
+    def follow(self, pos: tuple[float, float]):
+        """
+        指定した位置が画面の中央に来るように動く
+        引数 pos：追いかける位置（ワールド座標）
+        """
+        self.view.center = (int(pos[0]), int(pos[1]))
+        self.view.clamp_ip(self.world)
+
+    @property
+    def offset(self) -> tuple[int, int]:
+        """
+        ワールド座標に足すと画面上の座標になる量
+        """
+        return -self.view.x, -self.view.y
+
+    def chunks(self) -> list[tuple[int, int]]:
+        """
+        画面に映っている区画の番号を返す
+        戻り値：（横の番号, 縦の番号）のリスト
+        """
+        v = self.view
+        return [(cx, cy)
+                for cy in range(v.top // CHUNK_SIZE, (v.bottom - 1) // CHUNK_SIZE + 1)
+                for cx in range(v.left // CHUNK_SIZE, (v.right - 1) // CHUNK_SIZE + 1)]
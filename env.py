@@ -0,0 +1,500 @@
+"""
+自動プレイヤーの学習・評価のための，画面なしで進めるゲーム環境
+GameEnv：Gameを1つ包み，reset()/step()で観測・報酬・終了を返す
+VectorEnv：N個のゲームを同じステップで並べて進める（こうかとんとりんごの状態をNumPy配列で持つ）
+例：python env.py --envs 1024 --steps 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import numpy as np
+import pygame as pg
+
+import Gravity_koukaton as game_mod
+from levels import load_levels
+from solver import HELD, KEYDOWNS
+NUM_ACTIONS = len(HELD) * len(KEYDOWNS)  # 行動の番号は HELDの番号×3＋KEYDOWNSの番号
+NONE, GOAL, ENEMY, THORN = 0, 1, 2, 3  # ステップの結果の番号
+RESULTS = {None: NONE, "goal": GOAL, "enemy": ENEMY, "thorn": THORN}
+MAX_TICKS = 3000  # 1回のプレイの最大ステップ数（超えたら打ち切る）
+NEAREST_APPLES = 4  # 観測に含める近いりんごの数
+OBS_SIZE = 9 + NEAREST_APPLES * 2  # 観測の長さ
+REWARD_STAGE = 1.0  # ドアに着いたときの報酬
+REWARD_DEATH = -1.0  # りんごかとげに当たったときの報酬
+FAR = 10 ** 6  # 詰め物の床・りんご・とげを置く，何にも当たらない座標
+# こうかとんの（向き, 上下反転）．番号は（右向きなら2）＋（上下反転なら1）
+BIRD_VARIANTS = tuple((game_mod.Bird.delta[key], flipped)
+                      for key in (pg.K_LEFT, pg.K_RIGHT) for flipped in (False, True))
+
+
+def observe(x, y, vy, gsign, flag, world, door, apple_left, apple_top, apple_size, thorns,
+            bird_size) -> np.ndarray:
+    """
+    こうかとん・ステージ・りんごの状態から観測ベクトルを作る（GameEnvとVectorEnvで共通）
+    すべて長さNの配列（りんごは(N, りんごの数)，とげは(N, とげの数, 4)）で受け取る
+    観測の中身（座標は画面の幅・高さで割り，-1～1に切り詰める）：
+        こうかとんの中心の位置（ステージの大きさで割る）2つ，縦方向の速度/10，重力の向き，地面にいるか，
+        ドアまでの差（ドアがなければ0）2つ，一番近いとげの帯までの差2つ，近い順にNEAREST_APPLES個のりんごまでの差
+    引数1～5 x, y, vy, gsign, flag：こうかとんの左上の座標，縦方向の速度，重力の向き（+1/-1），空中にいるか
+    引数6 world：ステージの（幅, 高さ）の(N, 2)配列
+    引数7 door：ドアの（左, 上, 右, 下）の(N, 4)配列（ドアがなければFAR）
+    引数8～10 apple_left, apple_top, apple_size：りんごの左端・上端の配列と（幅, 高さ）
+    引数11 thorns：とげの帯の（左, 上, 右, 下）の配列
+    引数12 bird_size：こうかとんの（幅, 高さ）
+    戻り値：(N, OBS_SIZE)のfloat32配列
+    """
+    bw, bh = bird_size
+    aw, ah = apple_size
+    cx = x + bw / 2
+    cy = y + bh / 2
+    scale = np.array([game_mod.WIDTH, game_mod.HEIGHT], dtype=np.float64)
+    obs = np.empty((len(x), OBS_SIZE), dtype=np.float32)
+    obs[:, 0] = cx / world[:, 0]
+    obs[:, 1] = cy / world[:, 1]
+    obs[:, 2] = vy / 10
+    obs[:, 3] = gsign
+    obs[:, 4] = ~flag
+    has_door = door[:, 0] < FAR
+    obs[:, 5] = np.where(has_door, ((door[:, 0] + door[:, 2]) / 2 - cx) / scale[0], 0)
+    obs[:, 6] = np.where(has_door, ((door[:, 1] + door[:, 3]) / 2 - cy) / scale[1], 0)
+    # とげの帯は中心ではなく帯の中で一番近い点までの差を見る
+    tdx = np.clip(cx[:, None], thorns[:, :, 0], thorns[:, :, 2]) - cx[:, None]
+    tdy = np.clip(cy[:, None], thorns[:, :, 1], thorns[:, :, 3]) - cy[:, None]
+    rows = np.arange(len(x))
+    if thorns.shape[1]:
+        i = np.argmin(tdx * tdx + tdy * tdy, axis=1)
+        obs[:, 7] = tdx[rows, i] / scale[0]
+        obs[:, 8] = tdy[rows, i] / scale[1]
+    else:
+        obs[:, 7:9] = 1
+    adx = apple_left + aw / 2 - cx[:, None]
+    ady = apple_top + ah / 2 - cy[:, None]
+    dist = adx * adx + ady * ady
+    k = min(NEAREST_APPLES, dist.shape[1])
+    if k:
+        near = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        near = np.take_along_axis(near, np.argsort(np.take_along_axis(dist, near, 1), axis=1), 1)
+        pad = np.take_along_axis(apple_left, near, 1) >= FAR  # 詰め物のりんごはいないものとして扱う
+        obs[:, 9:9 + k * 2:2] = np.where(pad, 1, np.take_along_axis(adx, near, 1) / scale[0])
+        obs[:, 10:10 + k * 2:2] = np.where(pad, 1, np.take_along_axis(ady, near, 1) / scale[1])
+    obs[:, 9 + k * 2:] = 1
+    np.clip(obs[:, 5:], -1, 1, out=obs[:, 5:])
+    return obs
+
+
+def overlap_table(mask: pg.mask.Mask, other: pg.mask.Mask) -> np.ndarray:
+    """
+    otherの左上をmaskの左上から(dx, dy)ずらして置いたときに画素が重なるかの表を作る
+    引数1 mask：基準にするマスク
+    引数2 other：ずらして置くマスク
+    戻り値：[dy + otherの高さ - 1, dx + otherの幅 - 1]が重なるならTrueのbool配列
+    """
+    conv = mask.convolve(other)  # otherの右下を(x, y)に置いたときに重なる位置のビットが立つ
+    surf = conv.to_surface(setcolor=(255, 255, 255, 255), unsetcolor=(0, 0, 0, 255))
+    return pg.surfarray.array_red(surf).T > 0
+
+
+class GameEnv:
+    """
+    Gameを1つ包んだ環境（物理演算はGame.step()そのもの）
+    行動は0～NUM_ACTIONS-1の整数で，押しっぱなしのキー（なし・左・右）と押すキー（なし・SPACE・g）の組を表す
+    """
+    def __init__(self, levels: list[dict] | None = None, max_ticks: int = MAX_TICKS):
+        """
+        引数1 levels：遊ぶステージのデータのリスト（省略時はステージデータファイルから読み込む）
+        引数2 max_ticks：1回のプレイの最大ステップ数
+        """
+        pg.init()
+        self.levels = load_levels() if levels is None else levels
+        self.max_ticks = max_ticks
+        self.key_states = [game_mod.KeyState(held) for held in HELD]
+        self.events = [game_mod.keydown_events(keys) for keys in KEYDOWNS]
+        self.game: game_mod.Game | None = None
+
+    def reset(self, stage: int = 0) -> np.ndarray:
+        """
+        新しいゲームを始める
+        引数 stage：始めるステージ番号
+        戻り値：観測ベクトル
+        """
+        self.game = game_mod.Game(self.levels)
+        if stage:
+            self.game.stage.load_stage(stage)
+            self.game.stage.setup_door(self.game.bird)
+        return self.observe()
+
+    def step(self, action: int) -> tuple[np.ndarray, float, bool, dict]:
+        """
+        ゲームを1ステップ進める
+        引数 action：行動の番号
+        戻り値：（観測ベクトル, 報酬, 終わったか, 情報の辞書）のタプル
+            情報の辞書のresultはGame.step()の戻り値，truncatedは最大ステップ数で打ち切ったか
+        """
+        game = self.game
+        index = game.stage.current_stage_index
+        h, k = divmod(action, len(KEYDOWNS))
+        result = game.step(self.key_states[h], self.events[k])
+        reward = 0.0
+        if result == "goal" or game.stage.current_stage_index != index:
+            reward = REWARD_STAGE
+        elif result is not None:
+            reward = REWARD_DEATH
+        truncated = result is None and game.tmr >= self.max_ticks
+        return self.observe(), reward, result is not None or truncated, {"result": result, "truncated": truncated}
+
+    def observe(self) -> np.ndarray:
+        """
+        現在の状態の観測ベクトルを返す
+        戻り値：長さOBS_SIZEのfloat32配列
+        """
+        game = self.game
+        bird, stage, apples = game.bird, game.stage, game.stage.apples
+        door = stage.door_rect
+        thorns = np.array([[t.rct.left, t.rct.top, t.rct.right, t.rct.bottom] for t in stage.thorns],
+                          dtype=np.int64).reshape(1, -1, 4)
+        return observe(
+            np.array([bird.rct.x]), np.array([bird.rct.y]), np.array([bird.vy], dtype=np.float64),
+            np.array([1 if game.gravity_manager.gravity > 0 else -1]), np.array([game.gravity_manager.flag]),
+            np.array([stage.world.size]),
+            np.array([[FAR] * 4 if door is None else [door.left, door.top, door.right, door.bottom]]),
+            apples.left[None], apples.top[None], (apples.w, apples.h), thorns, bird.rct.size,
+        )[0]
+
+
+class VectorEnv:
+    """
+    N個のゲームを同じステップで並べて進める環境
+    こうかとんの位置・速度・重力の向きとりんごの位置を(N, ...)のNumPy配列で持ち，
+    Game.step()と同じ処理を配列演算でまとめて行う（ステージ切り替えメッセージなど描画だけの状態は持たない）
+    りんごととげの画素単位の当たり判定は，ずらし方ごとに重なるかをあらかじめ表にしておき，Rectが重なったものだけ表を引く
+    終わったゲームはそのステップのうちに最初のステージからやり直す
+    """
+    def __init__(self, num_envs: int, levels: list[dict] | None = None, max_ticks: int = MAX_TICKS):
+        """
+        引数1 num_envs：並べるゲームの数
+        引数2 levels：遊ぶステージのデータのリスト（省略時はステージデータファイルから読み込む）
+        引数3 max_ticks：1回のプレイの最大ステップ数
+        """
+        pg.init()
+        self.levels = load_levels() if levels is None else levels
+        self.num_envs = num_envs
+        self.max_ticks = max_ticks
+        game_mod.Bird.load_images()
+        self.bird_size = game_mod.Bird.img1.get_size()
+        # 物理演算の値はゲーム本体の初期値から取る（重力の向きが+1のときの値）
+        gravity = game_mod.Gravity()
+        bird = game_mod.Bird((0, 0), gravity)
+        self.gravity, self.jump_power = gravity.gravity, gravity.jump_power
+        self.start_dire = bird.dire[0]
+        self.held_dx = np.array([sum(game_mod.Bird.delta[k][0] for k in keys) for keys in HELD])  # HELDごとの横の移動量
+        self._build_tables()
+        n, a = num_envs, self.level_apple_left.shape[1]
+        self.x = np.zeros(n, dtype=np.int64)  # こうかとんの左上の座標
+        self.y = np.zeros(n, dtype=np.int64)
+        self.vy = np.zeros(n, dtype=np.float64)
+        self.gsign = np.ones(n, dtype=np.int64)  # 重力の向き（+1：下向き，-1：上向き）
+        self.dire = np.full(n, self.start_dire, dtype=np.int64)  # 横の向き（Bird.direの横方向）
+        self.flag = np.zeros(n, dtype=bool)  # 空中にいるか（Gravity.flag）
+        self.stage = np.zeros(n, dtype=np.int64)
+        self.tmr = np.zeros(n, dtype=np.int64)
+        self.apple_top = np.zeros((n, a), dtype=np.int64)
+        # 今いるステージの表を行ごとに写したもの（ステージが変わった行だけ書き換える）
+        self.platforms = np.zeros((n,) + self.level_platforms.shape[1:], dtype=np.int64)
+        self.thorns = np.zeros((n,) + self.level_thorns.shape[1:], dtype=np.int64)
+        self.thorn_base = np.zeros((n,) + self.level_thorn_base.shape[1:], dtype=np.int64)
+        self.door = np.zeros((n, 4), dtype=np.int64)
+        self.world = np.zeros((n, 2), dtype=np.int64)
+        self.apple_l = np.zeros((n, a), dtype=np.int64)
+        self.apple_vy = np.zeros((n, a), dtype=np.int64)
+
+    def _build_tables(self):
+        """
+        ステージごとの床・とげ・ドア・りんごを，一番多いステージに合わせて詰め物をした配列にまとめる
+        りんごととげの列については，こうかとんの画像ごとの重なりの表（overlap_table()）も作る
+        """
+        bw, bh = self.bird_size
+        bird_masks = [game_mod.Bird.masks[v] for v in BIRD_VARIANTS]
+        stages = []
+        for level in self.levels:
+            world = game_mod.stage_world(level).size
+            apples = game_mod.Enemies(level["apples"], world[1])
+            thorns = [game_mod.ThornStrip(tuple(xy), count, d) for xy, count, d in level["thorns"]]
+            stages.append((level, world, apples, thorns))
+        self.apple_size = (stages[0][2].w, stages[0][2].h)
+        self.apple_hit = np.stack([overlap_table(m, stages[0][2].mask) for m in bird_masks])  # [画像, dy, dx]
+        count = len(stages)
+        p = max(max(len(level["platforms"]) for level, *_ in stages), 1)
+        t = max(max(len(thorns) for *_, thorns in stages), 1)
+        a = max(max(len(apples) for _, _, apples, _ in stages), 1)
+        far = (FAR, FAR, FAR, FAR)  # 左＝右なので何とも重ならない
+        self.level_platforms = np.full((count, p, 4), FAR, dtype=np.int64)
+        self.level_thorns = np.full((count, t, 4), FAR, dtype=np.int64)
+        # とげの列ごと・こうかとんの画像ごとの表は大きさが違うので，1次元につないで先頭の位置を覚えておく
+        self.level_thorn_base = np.zeros((count, t, len(BIRD_VARIANTS)), dtype=np.int64)
+        tables = []
+        size = 0
+        self.level_door = np.full((count, 4), FAR, dtype=np.int64)
+        self.level_start = np.zeros((count, 2), dtype=np.int64)
+        self.level_world = np.zeros((count, 2), dtype=np.int64)
+        self.level_apple_left = np.full((count, a), FAR, dtype=np.int64)
+        self.level_apple_top = np.full((count, a), 100, dtype=np.int64)  # 詰め物のりんごは動かない
+        self.level_apple_vy = np.zeros((count, a), dtype=np.int64)
+        for i, (level, world, apples, thorns) in enumerate(stages):
+            for j, (x, y, w, h) in enumerate(level["platforms"]):
+                self.level_platforms[i, j] = (x, y, x + w, y + h)
+            for j, strip in enumerate(thorns):
+                r = strip.rct
+                self.level_thorns[i, j] = (r.left, r.top, r.right, r.bottom)
+                for v, m in enumerate(bird_masks):
+                    table = overlap_table(m, strip.mask)
+                    self.level_thorn_base[i, j, v] = size
+                    tables.append(table.ravel())
+                    size += table.size
+            if level["door"] is not None:
+                x, y = level["door"]
+                self.level_door[i] = (x, y, x + bw, y + bh)  # ドアはこうかとんと同じ大きさ
+            else:
+                self.level_door[i] = far
+            self.level_start[i] = level["start"]
+            self.level_world[i] = world
+            self.level_apple_left[i, :len(apples)] = apples.left
+            self.level_apple_top[i, :len(apples)] = apples.top
+            self.level_apple_vy[i, :len(apples)] = apples.vy
+        self.thorn_hit = np.concatenate(tables) if tables else np.zeros(1, dtype=bool)
+
+    def _enter(self, rows: np.ndarray, stages: np.ndarray):
+        """
+        指定した行のゲームを指定したステージの初期状態にする（Stege.load_stage()とsetup_door()に当たる）
+        引数1 rows：行の番号の配列
+        引数2 stages：入るステージ番号の配列
+        """
+        bw, bh = self.bird_size
+        self.stage[rows] = stages
+        self.x[rows] = self.level_start[stages, 0] - bw // 2
+        self.y[rows] = self.level_start[stages, 1] - bh // 2
+        self.platforms[rows] = self.level_platforms[stages]
+        self.thorns[rows] = self.level_thorns[stages]
+        self.thorn_base[rows] = self.level_thorn_base[stages]
+        self.door[rows] = self.level_door[stages]
+        self.world[rows] = self.level_world[stages]
+        self.apple_l[rows] = self.level_apple_left[stages]
+        self.apple_top[rows] = self.level_apple_top[stages]
+        self.apple_vy[rows] = self.level_apple_vy[stages]
+
+    def _reset_rows(self, rows: np.ndarray, stage: int = 0):
+        """
+        指定した行のゲームを新しく始める
+        引数1 rows：行の番号の配列
+        引数2 stage：始めるステージ番号
+        """
+        self.vy[rows] = 0
+        self.gsign[rows] = 1
+        self.dire[rows] = self.start_dire
+        self.flag[rows] = False
+        self.tmr[rows] = 0
+        self._enter(rows, np.full(len(rows), stage, dtype=np.int64))
+
+    def reset(self, stage: int = 0) -> np.ndarray:
+        """
+        すべてのゲームを新しく始める
+        引数 stage：始めるステージ番号
+        戻り値：(N, OBS_SIZE)の観測の配列
+        """
+        self._reset_rows(np.arange(self.num_envs), stage)
+        return self.observe()
+
+    def step(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+        """
+        すべてのゲームを1ステップ進める（Game.step()と同じ順番で判定する）
+        引数 actions：ゲームごとの行動の番号の配列
+        戻り値：（観測, 報酬, 終わったか, 情報の辞書）のタプル（観測以外は長さNの配列）
+            情報の辞書のresultは結果の番号（NONE/GOAL/ENEMY/THORN），truncatedは最大ステップ数で打ち切ったか
+            終わったゲームの観測はやり直した後のもの
+        """
+        held, key = np.divmod(np.asarray(actions), len(KEYDOWNS))
+        bw, bh = self.bird_size
+        aw, ah = self.apple_size
+        x, y, vy, gsign, flag = self.x, self.y, self.vy, self.gsign, self.flag
+        rows = np.arange(self.num_envs)
+        reward = np.zeros(self.num_envs, dtype=np.float32)
+        result = np.zeros(self.num_envs, dtype=np.int64)
+
+        # 床に当たっていたら最初に当たった床の上（重力反転中は下）に乗せる（Stege.hit_stage()）
+        p = self.platforms
+        hit = ((x[:, None] < p[:, :, 2]) & (x[:, None] + bw > p[:, :, 0])
+               & (y[:, None] < p[:, :, 3]) & (y[:, None] + bh > p[:, :, 1]))
+        on = hit.any(axis=1)
+        first = hit.argmax(axis=1)
+        y[:] = np.where(on, np.where(gsign < 0, p[rows, first, 3], p[rows, first, 1] - bh), y)
+        vy[on] = 0
+        d = self.door
+        at_door = (x < d[:, 2]) & (x + bw > d[:, 0]) & (y < d[:, 3]) & (y + bh > d[:, 1])
+        flag[:] = np.where(at_door, flag, ~on)
+        last = self.stage == len(self.levels) - 1
+        result[at_door & last] = GOAL
+        reward[at_door] = REWARD_STAGE
+        entering = np.flatnonzero(at_door & ~last)
+        if len(entering):
+            self._enter(entering, self.stage[entering] + 1)
+
+        # ジャンプと重力反転（Game.handle_event()）
+        jump = (key == 1) & ~flag
+        vy[jump] = self.jump_power * gsign[jump]
+        flag |= jump
+        gsign[key == 2] *= -1
+
+        # Rectが重なったりんごだけ画素単位で確かめる（Enemies.hits()）
+        top = self.apple_top
+        alive = result == NONE
+        near = (alive[:, None] & (self.apple_l < (x + bw)[:, None]) & (self.apple_l + aw > x[:, None])
+                & (top < (y + bh)[:, None]) & (top > (y - ah)[:, None]))
+        r, c = np.nonzero(near)
+        variant = (self.dire > 0) * 2 + (gsign < 0)
+        hit = self.apple_hit[variant[r], top[r, c] - y[r] + ah - 1, self.apple_l[r, c] - x[r] + aw - 1]
+        enemy = np.zeros(self.num_envs, dtype=bool)
+        enemy[r[hit]] = True
+        result[enemy] = ENEMY
+
+        # こうかとんの移動（Bird.update()）
+        dx = self.held_dx[held]
+        w, h = self.world[:, 0], self.world[:, 1]
+        nx = x + dx
+        inside = (nx >= 0) & (nx + bw <= w) & (y >= 0) & (y + bh <= h)
+        x[:] = np.where(inside, nx, x)
+        prev_y = y.copy()
+        vy += self.gravity * gsign
+        c = y + bh // 2 + vy
+        y[:] = np.sign(c) * np.floor(np.abs(c) + 0.5) - bh // 2  # pg.Rectと同じく0から遠い方に丸める
+        ground = (gsign > 0) & (y + bh >= h)
+        y[ground] = h[ground] - bh
+        ceiling = (gsign < 0) & (y <= 0)
+        y[ceiling] = 0
+        vy[ground | ceiling] = 0
+        flag[ground] = False
+        self.dire[dx != 0] = dx[dx != 0]
+
+        # 縦に自分の高さより大きく動いた行は，道のりの途中の床・とげ・りんごも調べる（Stege.sweep()）
+        swept = np.zeros(self.num_envs, dtype=np.int64)
+        fast = np.flatnonzero(alive & ~enemy & (np.abs(y - prev_y) > bh))
+        if len(fast):
+            swept[fast] = self._sweep(fast, prev_y)
+        result[swept != NONE] = swept[swept != NONE]
+
+        # Rectが重なったとげの列だけ画素単位で確かめる（ThornStrip.hits()）
+        t = self.thorns
+        near = ((alive & ~enemy & (swept == NONE))[:, None] & (x[:, None] < t[:, :, 2]) & (x[:, None] + bw > t[:, :, 0])
+                & (y[:, None] < t[:, :, 3]) & (y[:, None] + bh > t[:, :, 1]))
+        r, c = np.nonzero(near)
+        variant = (self.dire > 0) * 2 + (gsign < 0)
+        tx, ty = t[r, c, 0], t[r, c, 1]
+        sw, sh = t[r, c, 2] - tx, t[r, c, 3] - ty
+        index = self.thorn_base[r, c, variant[r]] + (ty - y[r] + sh - 1) * (bw + sw - 1) + (tx - x[r] + sw - 1)
+        thorn = np.zeros(self.num_envs, dtype=bool)
+        thorn[r[self.thorn_hit[index]]] = True
+        result[thorn] = THORN
+        reward[(result == ENEMY) | (result == THORN)] = REWARD_DEATH
+
+        # りんごの移動（Enemies.update()）
+        game_mod.Enemies.move_tops(top, self.apple_vy, ah, h[:, None])
+        self.tmr += 1
+
+        truncated = (result == NONE) & (self.tmr >= self.max_ticks)
+        done = (result != NONE) | truncated
+        if done.any():
+            self._reset_rows(np.flatnonzero(done))
+        return self.observe(), reward, done, {"result": result, "truncated": truncated}
+
+    def _sweep(self, rows: np.ndarray, prev_y: np.ndarray) -> np.ndarray:
+        """
+        縦に速く動いた行の道のりを掃いて，床・とげ・りんごに最初に当たった位置まで戻す（Stege.sweep()と同じ判定）
+        床を丸ごと通り抜けた行は床と1pxだけ重なる位置まで，その手前でとげかりんごに当たった行は当たった位置まで戻す
+        引数1 rows：調べる行の番号の配列
+        引数2 prev_y：全行の移動前のこうかとんの上端y座標
+        戻り値：行ごとの結果の番号（とげならTHORN，りんごならENEMY，それ以外はNONE）
+        """
+        bw, bh = self.bird_size
+        aw, ah = self.apple_size
+        x, y, y0 = self.x[rows, None], self.y[rows, None], prev_y[rows, None]
+        dist = np.abs(y - y0)
+        down = y > y0
+        sign = np.where(down, 1, -1)
+
+        def span(left, top, right, bottom):  # sweep_span()と同じく，重なる距離の範囲（両端は含まない）を求める
+            d0 = np.where(down, top - (y0 + bh), y0 - bottom)
+            d1 = np.where(down, bottom - y0, y0 + bh - top)
+            return (x < right) & (x + bw > left), d0, d1
+
+        p = self.platforms[rows]
+        side, d0, d1 = span(p[:, :, 0], p[:, :, 1], p[:, :, 2], p[:, :, 3])
+        crossed = side & (d0 >= 0) & (d1 <= dist)  # 丸ごと通り抜けた床
+        stop = np.where(crossed, d0 + 1, dist).min(axis=1, keepdims=True)  # 調べる道のりの長さ
+
+        def first_hit(side, d0, d1, lookup) -> np.ndarray:  # 画素単位で最初に当たる距離（当たらなければFAR）
+            lo = np.maximum(d0 + 1, 1)
+            hi = np.minimum(d1, stop)
+            d = lo[..., None] + np.arange(max(int((hi - lo).max(initial=0)), 0))
+            valid = side[..., None] & (d < hi[..., None])
+            hit = valid & lookup(y0[..., None] + sign[..., None] * d, valid)
+            return np.where(hit, d, FAR).min(axis=(1, 2), initial=FAR)
+
+        variant = ((self.dire[rows] > 0) * 2 + (self.gsign[rows] < 0))[:, None, None]
+        t = self.thorns[rows]
+        tx, ty = t[:, :, 0, None], t[:, :, 1, None]
+        sw, sh = t[:, :, 2, None] - tx, t[:, :, 3, None] - ty
+        base = np.take_along_axis(self.thorn_base[rows], np.broadcast_to(variant, t.shape[:2] + (1,)), axis=2)
+
+        def thorn_lookup(yd, valid):
+            index = base + (ty - yd + sh - 1) * (bw + sw - 1) + (tx - x[..., None] + sw - 1)
+            return self.thorn_hit[np.where(valid, index, 0)]
+
+        thorn_d = first_hit(*span(t[:, :, 0], t[:, :, 1], t[:, :, 2], t[:, :, 3]), thorn_lookup)
+        left, top = self.apple_l[rows], self.apple_top[rows]
+
+        def apple_lookup(yd, valid):
+            dy = np.where(valid, top[..., None] - yd + ah - 1, 0)
+            dx = np.where(valid, left[..., None] - x[..., None] + aw - 1, 0)
+            return self.apple_hit[np.broadcast_to(variant, dy.shape), dy, dx]
+
+        apple_d = first_hit(*span(left, top, left + aw, top + ah), apple_lookup)
+        hit = np.minimum(thorn_d, apple_d)
+        d = np.where(hit < FAR, hit, stop[:, 0])
+        self.y[rows] = y0[:, 0] + sign[:, 0] * d
+        return np.where(hit == FAR, NONE, np.where(thorn_d <= apple_d, THORN, ENEMY))
+
+    def observe(self) -> np.ndarray:
+        """
+        現在の状態の観測を返す
+        戻り値：(N, OBS_SIZE)のfloat32配列
+        """
+        return observe(self.x, self.y, self.vy, self.gsign, self.flag, self.world, self.door,
+                       self.apple_l, self.apple_top, self.apple_size, self.thorns, self.bird_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--envs", type=int, default=1024, help="並べるゲームの数")
+    parser.add_argument("--steps", type=int, default=2000, help="進めるステップ数")
+    parser.add_argument("--seed", type=int, default=0, help="行動を選ぶ乱数のシード")
+    args = parser.parse_args()
+
+    env = VectorEnv(args.envs)
+    env.reset()
+    rng = np.random.default_rng(args.seed)
+    actions = rng.integers(0, NUM_ACTIONS, size=(args.steps, args.envs))
+    episodes = 0
+    t0 = time.perf_counter()
+    for a in actions:
+        _, _, done, _ = env.step(a)
+        episodes += int(done.sum())
+    elapsed = time.perf_counter() - t0
+    steps = args.steps * args.envs
+    print(f"{steps} steps ({episodes} episodes) in {elapsed:.2f}s = {steps / elapsed:.0f} steps/s")
+    pg.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+ステージデータファイルの読み書き
+ここではデータ（座標や数値）だけを扱い，ゲームのオブジェクトは生成しない
+"""
+import json
+import os
+
+
+LEVEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stages.json")  # ステージデータファイルのパス
+STAGE_KEYS = ("platforms", "door", "start", "apples", "thorns")  # 1ステージに必要な項目
+# 省略できる項目："size"（ステージ全体の[幅, 高さ]．省略時と画面より小さいときは画面1枚分）
+THORN_DIRECTIONS = ("upper", "under", "left", "right")  # とげの向き
+
+
+def check_stage(stage: dict, index: int = 0):
+    """
+    1ステージ分のデータに必要な項目がそろっているかを確認する
+    引数1 stage：ステージのデータ
+    引数2 index：エラーメッセージに使うステージ番号
+    """
+    for key in STAGE_KEYS:
+        if key not in stage:
+            raise ValueError(f"stage {index + 1}: '{key}' がありません")
+    for _, _, direction in stage["thorns"]:
+        if direction not in THORN_DIRECTIONS:
+            raise ValueError(f"stage {index + 1}: とげの向き '{direction}' は使えません")
+    size = stage.get("size")
+    if size is not None and (len(size) != 2 or min(size) <= 0):
+        raise ValueError(f"stage {index + 1}: 'size' は正の[幅, 高さ]で指定してください")
+
+
+def load_levels(path: str = LEVEL_FILE) -> list[dict]:
+    """
+    ステージデータファイルを読み込む
+    引数 path：ステージデータファイルのパス
+    戻り値：ステージごとのデータのリスト
+    """
+    with open(path, encoding="utf-8") as f:
+        stages = json.load(f)["stages"]
+    for i, stage in enumerate(stages):
+        check_stage(stage, i)
+    return stages
+
+
+def save_levels(stages: list[dict], path: str = LEVEL_FILE):
+    """
+    ステージデータをファイルに書き出す
+    引数1 stages：ステージごとのデータのリスト
+    引数2 path：書き出すファイルのパス
+    """
+    for i, stage in enumerate(stages):
+        check_stage(stage, i)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"stages": stages}, f, ensure_ascii=False, indent=1)
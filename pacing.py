@@ -0,0 +1,83 @@
+"""
+描画の目標フレームレートに合わせてフレームの間隔を調整する仕組み
+遅れているときは描画だけを飛ばし，物理演算（Game.step）は飛ばさない
+"""
+import time
+
+
+MAX_SKIP = 4  # 続けて描画を飛ばす最大フレーム数（遅れていてもこれより間をあけずに描く）
+MAX_LAG = 0.25  # これ以上遅れたら取り戻すのをあきらめ，予定を今に合わせる[秒]
+SMOOTHING = 0.9  # 処理時間の移動平均で前回までの値にかける重み
+
+
+class FrameScheduler:
+    """
+    フレームごとに描き終えるべき時刻（締め切り）を決め，間に合うときは締め切りまで待ち，
+    遅れているときは描画を飛ばして追いつくクラス
+    更新（イベントと物理演算）と描画にかかった時間を測り，飛ばしたフレーム数と一緒に報告する
+    """
+    def __init__(self, fps: float, max_skip: int = MAX_SKIP):
+        """
+        引数1 fps：目標フレームレート
+        引数2 max_skip：続けて描画を飛ばす最大フレーム数
+        """
+        self.frame_time = 1 / fps
+        self.max_skip = max_skip
+        self.update_time = 0.0  # 更新にかかる時間の移動平均[秒]
+        self.draw_time = 0.0  # 描画にかかる時間の移動平均[秒]
+        self.frames = 0  # 数えたフレーム数
+        self.dropped = 0  # 描画を飛ばしたフレーム数
+        self._skipped = 0  # 今続けて飛ばしているフレーム数
+        self._deadline = time.perf_counter() + self.frame_time
+        self._t_begin = 0.0
+        self._t_draw = 0.0
+
+    def begin_frame(self):
+        """
+        フレームの処理を始める（更新にかかる時間を測り始める）
+        """
+        self._t_begin = time.perf_counter()
+
+    def should_draw(self) -> bool:
+        """
+        更新が終わった後に呼び，このフレームを描画するかを決める
+        締め切りを1フレーム分以上過ぎていたら描画を飛ばす
+        （描画が1フレームより重いだけなら毎回飛ばさず，遅れがたまったときだけ飛ばして追いつく）
+        戻り値：描画するならTrue（Falseのときは飛ばしたフレームとして数える）
+        """
+        now = time.perf_counter()
+        self.update_time = self.update_time * SMOOTHING + (now - self._t_begin) * (1 - SMOOTHING)
+        self._t_draw = now
+        if now - self._deadline > self.frame_time and self._skipped < self.max_skip:
+            self._skipped += 1
+            self.dropped += 1
+            return False
+        self._skipped = 0
+        return True
+
+    def end_draw(self):
+        """
+        描画（画面への反映まで）が終わったときに呼び，描画にかかった時間を記録する
+        """
+        self.draw_time = self.draw_time * SMOOTHING + (time.perf_counter() - self._t_draw) * (1 - SMOOTHING)
+
+    def wait(self):
+        """
+        締め切りまで待ち，次のフレームの締め切りを決める（遅れているときは待たない）
+        """
+        self.frames += 1
+        now = time.perf_counter()
+        if now < self._deadline:
+            time.sleep(self._deadline - now)
+        elif now - self._deadline > MAX_LAG:  # 遅れが大きすぎるときは後から詰め込まない
+            self._deadline = now
+        self._deadline += self.frame_time
+
+    def summary(self) -> str:
+        """
+        描画を飛ばしたフレーム数と平均の処理時間を文字列で返す
+        戻り値：表示用の文字列
+        """
+        rate = self.dropped / self.frames * 100 if self.frames else 0.0
+        return (f"dropped {self.dropped}/{self.frames} frames ({rate:.1f}%)  "
+                f"update {self.update_time * 1000:.2f}ms  draw {self.draw_time * 1000:.2f}ms")
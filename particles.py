@@ -0,0 +1,138 @@
+"""
+爆発などの演出に使うパーティクル
+粒子ごとのオブジェクトは作らず，位置・速度・残り寿命をあらかじめ確保したNumPy配列で持つ
+"""
+import math
+
+import numpy as np
+import pygame as pg
+
+
+MAX_PARTICLES = 2048  # 同時に出せる粒子の数（超えたら寿命の残りが少ないものから使い回す）
+DRAG = 0.96  # 1ステップごとに速度にかける減衰率
+
+
+def dot_frames(color: tuple[int, int, int], radius: int, steps: int = 4) -> list[pg.Surface]:
+    """
+    寿命が減るにつれて小さくなる丸い粒子の画像を作る
+    引数1 color：色
+    引数2 radius：生まれたときの半径[px]
+    引数3 steps：大きさの段階数
+    戻り値：寿命の残りが少ない順に並んだSurfaceのリスト
+    """
+    frames = []
+    for i in range(steps):
+        r = max(1, radius * (i + 1) // steps)
+        surf = pg.Surface((r * 2, r * 2), pg.SRCALPHA)
+        pg.draw.circle(surf, color, (r, r), r)
+        if pg.display.get_surface() is not None:
+            surf = surf.convert_alpha()
+        frames.append(surf)
+    return frames
+
+
+class ParticleSystem:
+    """
+    決まった数の粒子をまとめて動かし，まとめて描くクラス
+    粒子の種類（画像の並び）はadd_kind()で登録し，burst()で1か所から飛び散らせる
+    """
+    def __init__(self, capacity: int = MAX_PARTICLES, seed: int | None = None):
+        """
+        引数1 capacity：同時に出せる粒子の数
+        引数2 seed：飛び散る向きと速さを決める乱数のシード
+        """
+        self.pos = np.zeros((capacity, 2))  # 中心の位置（ワールド座標）
+        self.prev = np.zeros((capacity, 2))  # 1ステップ前の位置（描画の補間用）
+        self.vel = np.zeros((capacity, 2))
+        self.gravity = np.zeros(capacity)  # 縦方向の加速度
+        self.life = np.zeros(capacity, dtype=np.int64)  # 残り寿命[ステップ]（0なら空き）
+        self.max_life = np.ones(capacity, dtype=np.int64)
+        self.kind = np.zeros(capacity, dtype=np.int64)
+        self.kinds: list[list[pg.Surface]] = []  # 種類ごとの，寿命の残りが少ない順の画像
+        self._sizes: list[np.ndarray] = []  # 種類ごとの画像の（幅, 高さ）の配列
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.life))
+
+    def add_kind(self, frames: list[pg.Surface]) -> int:
+        """
+        粒子の種類を登録する
+        引数 frames：寿命の残りが少ない順に並んだ画像のリスト（寿命に応じて切り替える）
+        戻り値：種類の番号
+        """
+        self.kinds.append(frames)
+        self._sizes.append(np.array([f.get_size() for f in frames]))
+        return len(self.kinds) - 1
+
+    def burst(self, pos: tuple[float, float], count: int, kind: int, speed: tuple[float, float],
+              life: tuple[int, int], gravity: float = 0.0):
+        """
+        1か所から全方向に粒子を飛び散らせる
+        引数1 pos：飛び散る中心（ワールド座標）
+        引数2 count：粒子の数
+        引数3 kind：add_kind()で登録した種類の番号
+        引数4 speed：初速の（最小, 最大）[px/ステップ]
+        引数5 life：寿命の（最小, 最大）[ステップ]
+        引数6 gravity：縦方向の加速度（重力反転中は負にする）
+        """
+        count = min(count, len(self.life))
+        slots = np.argpartition(self.life, count - 1)[:count]  # 空き（寿命0）から順に使う
+        rng = self._rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        v = rng.uniform(speed[0], speed[1], count)
+        self.pos[slots] = pos
+        self.prev[slots] = pos
+        self.vel[slots, 0] = np.cos(angle) * v
+        self.vel[slots, 1] = np.sin(angle) * v
+        self.gravity[slots] = gravity
+        self.life[slots] = self.max_life[slots] = rng.integers(life[0], life[1] + 1, count)
+        self.kind[slots] = kind
+
+    def update(self):
+        """
+        生きている粒子だけを1ステップ進める（寿命の尽きた粒子は動かさない）
+        """
+        idx = np.flatnonzero(self.life)
+        if not len(idx):
+            return
+        vel = self.vel[idx]
+        vel[:, 1] += self.gravity[idx]
+        vel *= DRAG
+        self.vel[idx] = vel
+        self.prev[idx] = self.pos[idx]
+        self.pos[idx] += vel
+        self.life[idx] -= 1
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0, offset: tuple[int, int] = (0, 0)) -> list[pg.Rect]:
+        """
+        生きている粒子をまとめて描く
+        引数1 screen：画面Surface
+        引数2 alpha：1ステップ前の位置と現在位置の間のどこに描くか（0.0～1.0）
+        引数3 offset：ワールド座標から画面上の座標へのずれ（Camera.offset）
+        戻り値：描画した範囲のリスト（すべての粒子を囲む1つのRect．粒子がなければ空）
+        """
+        idx = np.flatnonzero(self.life)
+        if not len(idx):
+            return []
+        kind = self.kind[idx]
+        frame = np.zeros(len(idx), dtype=np.int64)
+        size = np.empty((len(idx), 2), dtype=np.int64)
+        for k in np.unique(kind):  # 種類ごとに，寿命の残りに応じた画像の番号と大きさを決める
+            sel = kind == k
+            frame[sel] = (self.life[idx[sel]] * len(self.kinds[k]) - 1) // self.max_life[idx[sel]]
+            size[sel] = self._sizes[k][frame[sel]]
+        center = self.prev[idx] + (self.pos[idx] - self.prev[idx]) * alpha + offset
+        topleft = center.astype(np.int64) - size // 2
+        kinds = self.kinds
+        screen.blits([(kinds[k][f], xy) for k, f, xy in zip(kind.tolist(), frame.tolist(), topleft.tolist())],
+                     doreturn=False)
+        x0, y0 = topleft.min(axis=0)
+        x1, y1 = (topleft + size).max(axis=0)
+        return [pg.Rect(x0, y0, x1 - x0, y1 - y0).clip(screen.get_rect())]
+
+    def clear(self):
+        """
+        すべての粒子を消す
+        """
+        self.life[:] = 0
@@ -0,0 +1,136 @@
+"""
+フレームごとの処理時間を計測して画面に表示する仕組み
+"""
+import time
+
+import pygame as pg
+
+from assets import texts
+
+
+HISTORY = 240  # グラフに表示するフレーム数
+GRAPH_SIZE = (240, 60)  # グラフの大きさ[px]
+GRAPH_MAX_MS = 40.0  # グラフの縦軸の上限[ms]
+TEXT_INTERVAL = 15  # 文字を描き直す間隔[フレーム]
+PHASES = ("events", "hit_stage", "bird", "enemies", "draw", "display", "wait")  # CSVに書き出す処理の名前
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    並べ替え済みのリストからパーセンタイル値を返す
+    引数1 sorted_values：昇順に並んだ値のリスト
+    引数2 p：パーセント（0～100）
+    戻り値：パーセンタイル値
+    """
+    if not sorted_values:
+        return 0.0
+    i = min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)
+    return sorted_values[i]
+
+
+class FrameProfiler:
+    """
+    1フレームを処理ごと（イベント・床判定・描画など）に区切って時間を測るクラス
+    mark()を呼ぶと前回のmark()からの経過時間がその名前に加算される
+    """
+    def __init__(self, out_path: str | None = None):
+        """
+        引数 out_path：フレームごとの計測値を書き出すCSVファイルのパス（Noneなら書き出さない）
+        """
+        self.enabled = out_path is not None  # ファイルに書き出すときは最初から計測する
+        self.frames = 0
+        self.history: list[float] = []  # 直近のフレーム時間[ms]
+        self.phases: dict[str, float] = {}  # 今のフレームの処理ごとの時間[s]
+        self.averages: dict[str, float] = {}  # 処理ごとの時間の移動平均[ms]
+        self.startup_ms: float | None = None  # 起動から最初のフレームまでの時間[ms]
+        self._t_frame = 0.0
+        self._t_mark = 0.0
+        self._out = None
+        if out_path:
+            self._out = open(out_path, "w", encoding="utf-8")
+            self._out.write(",".join(("frame", "total_ms") + PHASES) + "\n")
+        self._text: list[pg.Surface] = []
+        self._graph = pg.Surface(GRAPH_SIZE)
+        self._graph.set_alpha(200)
+
+    def toggle(self):
+        """
+        計測と表示のON/OFFを切り替える
+        """
+        self.enabled = not self.enabled
+        self.history.clear()
+        self.averages.clear()
+
+    def begin_frame(self):
+        """
+        フレームの計測を始める
+        """
+        self._t_frame = self._t_mark = time.perf_counter()
+        self.phases = {}
+
+    def mark(self, name: str):
+        """
+        前回のmark()（またはbegin_frame()）からの時間をnameの処理時間に加える
+        引数 name：処理の名前
+        """
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._t_mark
+        self._t_mark = now
+
+    def end_frame(self):
+        """
+        フレームの計測を終え，履歴に加える（CSVファイルがあれば1行書き出す）
+        """
+        total = (time.perf_counter() - self._t_frame) * 1000
+        self.frames += 1
+        self.history.append(total)
+        if len(self.history) > HISTORY:
+            del self.history[0]
+        for name, sec in self.phases.items():
+            ms = sec * 1000
+            self.averages[name] = self.averages.get(name, ms) * 0.95 + ms * 0.05
+        if self._out is not None:
+            values = [f"{self.phases.get(name, 0.0) * 1000:.3f}" for name in PHASES]
+            self._out.write(",".join([str(self.frames), f"{total:.3f}"] + values) + "\n")
+
+    def draw(self, screen: pg.Surface, notes: list[str] = ()) -> list[pg.Rect]:
+        """
+        フレーム時間のグラフとパーセンタイル，処理ごとの平均時間を画面左上に描く
+        引数1 screen：画面Surface
+        引数2 notes：最後に書き足す行のリスト
+        戻り値：描画した範囲のリスト
+        """
+        gw, gh = GRAPH_SIZE
+        self._graph.fill((0, 0, 0))
+        budget_y = gh - int(gh * 1000 / 50 / GRAPH_MAX_MS)  # 50FPSの予算の線
+        pg.draw.line(self._graph, (80, 80, 80), (0, budget_y), (gw, budget_y))
+        for x, ms in enumerate(self.history[-gw:]):
+            h = min(int(gh * ms / GRAPH_MAX_MS), gh)
+            color = (0, 200, 0) if gh - h > budget_y else (230, 60, 60)
+            pg.draw.line(self._graph, color, (x, gh - 1), (x, gh - h))
+        rects = [screen.blit(self._graph, (10, 50))]
+
+        if self.frames % TEXT_INTERVAL == 0 or not self._text:
+            font = texts.font(20)  # 数値が毎回変わるので文字画像はキャッシュしない
+            ordered = sorted(self.history)
+            lines = [
+                f"frame p50 {percentile(ordered, 50):.2f}ms  p95 {percentile(ordered, 95):.2f}ms"
+                f"  p99 {percentile(ordered, 99):.2f}ms",
+            ] + [f"{name:<10} {ms:.3f}ms" for name, ms in self.averages.items()]
+            if self.startup_ms is not None:
+                lines.append(f"startup    {self.startup_ms:.0f}ms")
+            lines.extend(notes)
+            self._text = [font.render(line, True, (255, 255, 255), (0, 0, 0)) for line in lines]
+        y = 50 + gh + 4
+        for text in self._text:
+            rects.append(screen.blit(text, (10, y)))
+            y += text.get_height()
+        return rects
+
+    def close(self):
+        """
+        CSVファイルを閉じる
+        """
+        if self._out is not None:
+            self._out.close()
+            self._out = None
@@ -0,0 +1,49 @@
+"""
+変化した部分だけを画面に反映する描画処理
+"""
+import pygame as pg
+
+
+class DirtyRenderer:
+    """
+    背景（動かないもの）を1枚のSurfaceとして持ち，
+    前のフレームで動くものを描いた場所だけ背景で塗り直して画面を更新するクラス
+    """
+    def __init__(self, screen: pg.Surface):
+        """
+        引数 screen：画面Surface
+        """
+        self.screen = screen
+        self.background: pg.Surface | None = None
+        self._prev_rects: list[pg.Rect] = []  # 前のフレームで描いた場所
+        self._full = True  # 次のフレームで画面全体を更新するか
+
+    def set_background(self, background: pg.Surface):
+        """
+        背景を差し替え，次のフレームで画面全体を描き直す
+        引数 background：画面と同じ大きさの背景Surface
+        """
+        self.background = background
+        self._full = True
+
+    def restore(self):
+        """
+        前のフレームで動くものを描いた場所を背景で塗り直す
+        """
+        if self._full:
+            self.screen.blit(self.background, (0, 0))
+            return
+        for rct in self._prev_rects:
+            self.screen.blit(self.background, rct, rct)
+
+    def present(self, rects: list[pg.Rect]):
+        """
+        今回描いた場所と前回描いた場所だけを画面に反映する
+        引数 rects：このフレームで動くものを描いた場所のリスト
+        """
+        if self._full:
+            pg.display.update()
+            self._full = False
+        else:
+            pg.display.update(self._prev_rects + rects)
+        self._prev_rects = rects
@@ -0,0 +1,81 @@
+"""
+キー入力の記録と再生
+1ステップごとに押されている左右キーとSPACE・Gの押下を小さなバイナリファイルに保存する
+"""
+import zlib
+
+import pygame as pg
+
+
+MAGIC = b"GKRP"  # ファイルの先頭に置く識別子
+VERSION = 1
+HELD_KEYS = (pg.K_LEFT, pg.K_RIGHT)  # 押しっぱなしを記録するキー（ビット0, 1）
+EVENT_KEYS = (pg.K_SPACE, pg.K_g)  # 押した瞬間を記録するキー（番号で記録する）
+MAX_EVENTS = 63  # 1ステップに記録できるイベント数
+
+
+class InputRecorder:
+    """
+    ステップごとの入力を記録するクラス
+    1ステップは「押しっぱなしのキーのビットとイベント数」の1バイトと，イベントごとの1バイトで表す
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.ticks = 0
+
+    def record(self, key_lst, events):
+        """
+        1ステップ分の入力を記録する（Game.step()に渡す直前に呼ぶ）
+        引数1 key_lst：押下キーの真理値リスト
+        引数2 events：このステップに渡すイベントのリスト
+        """
+        held = 0
+        for bit, key in enumerate(HELD_KEYS):
+            if key_lst[key]:
+                held |= 1 << bit
+        codes = [EVENT_KEYS.index(e.key) for e in events
+                 if e.type == pg.KEYDOWN and e.key in EVENT_KEYS][:MAX_EVENTS]
+        self.data.append(held | len(codes) << 2)
+        self.data.extend(codes)
+        self.ticks += 1
+
+    def save(self, path: str):
+        """
+        記録をファイルに書き出す
+        引数 path：書き出すファイルのパス
+        """
+        with open(path, "wb") as f:
+            f.write(MAGIC + bytes([VERSION]) + self.ticks.to_bytes(4, "little"))
+            f.write(zlib.compress(bytes(self.data), 9))
+
+
+class InputReplayer:
+    """
+    記録した入力を1ステップずつ取り出すクラス
+    反復すると（押されているキーの集まり, 押した瞬間のキーのリスト）をステップごとに返す
+    """
+    def __init__(self, path: str):
+        """
+        引数 path：InputRecorderで書き出したファイルのパス
+        """
+        with open(path, "rb") as f:
+            raw = f.read()
+        if raw[:4] != MAGIC or raw[4] != VERSION:
+            raise ValueError(f"{path} はリプレイファイルではありません")
+        self.ticks = int.from_bytes(raw[5:9], "little")
+        self.steps: list[tuple[frozenset, list[int]]] = []
+        data = zlib.decompress(raw[9:])
+        i = 0
+        while i < len(data):
+            head = data[i]
+            held = frozenset(key for bit, key in enumerate(HELD_KEYS) if head >> bit & 1)
+            n = head >> 2
+            keydowns = [EVENT_KEYS[c] for c in data[i + 1:i + 1 + n]]
+            self.steps.append((held, keydowns))
+            i += 1 + n
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __iter__(self):
+        return iter(self.steps)
@@ -0,0 +1,227 @@
+"""
+ステージをクリアできるかを画面なしで調べるソルバー
+ゲーム本体の物理演算（Game.step）で状態を1ステップずつ進め，A*探索でドアまでの（ほぼ）最短の入力列を求める
+例：python solver.py
+    python solver.py --replay-dir solutions
+"""
+import argparse
+import os
+import sys
+import heapq
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as pg
+
+import Gravity_koukaton as game_mod
+from levels import LEVEL_FILE, load_levels
+from replay import InputRecorder
+
+
+HELD = ((), (pg.K_LEFT,), (pg.K_RIGHT,))  # 押しっぱなしにするキーの選択肢
+KEYDOWNS = ((), (pg.K_SPACE,), (pg.K_g,))  # そのステップで押すキーの選択肢
+MAX_TICKS = 3000  # 探索する最大ステップ数（1分）
+MAX_NODES = 300_000  # 探索する最大状態数
+PERIOD_LIMIT = 5000  # りんごの動きの周期を探す最大ステップ数
+CELL_X = 3  # 状態をまとめる横方向の幅[px]（こうかとんの1ステップの移動量）
+CELL_Y = 10  # 状態をまとめる縦方向の幅[px]
+CELL_VY = 3.0  # 状態をまとめる縦方向の速度の幅
+CELL_T = 10  # 状態をまとめる時間の幅[ステップ]
+WEIGHT = 1.5  # ドアまでの残り距離の見積もりにかける重み（1.0なら最短の入力列を探す）
+
+
+def apple_cycle(specs: list, height: int = game_mod.HEIGHT, limit: int = PERIOD_LIMIT) -> tuple[int, int] | None:
+    """
+    りんごの位置が何ステップ目から何ステップごとに繰り返すかを調べる
+    引数1 specs：ステージデータのりんごのリスト
+    引数2 height：ステージ全体の高さ（りんごが折り返す位置）
+    引数3 limit：調べる最大ステップ数
+    戻り値：（繰り返しが始まるステップ, 周期）のタプル（見つからなければNone）
+    """
+    apples = game_mod.Enemies(specs, height)
+    seen = {}
+    for t in range(limit):
+        key = apples.top.tobytes()
+        if key in seen:
+            return seen[key], t - seen[key]
+        seen[key] = t
+        apples.update()
+    return None
+
+
+def solve_level(level: dict, max_ticks: int = MAX_TICKS, max_nodes: int = MAX_NODES,
+                weight: float = WEIGHT) -> dict:
+    """
+    1つのステージについて，スタート地点からドアに着けるかをA*探索で調べる
+    「経過ステップ数＋ドアまでの横の距離を歩くのにかかるステップ数×weight」が小さい状態から順に進める
+    位置・縦方向の速度・重力の向き・りんごの周期内の時刻が近い状態は一度だけ調べる
+    引数1 level：ステージのデータ
+    引数2 max_ticks：探索する最大ステップ数
+    引数3 max_nodes：探索する最大状態数
+    引数4 weight：距離の見積もりの重み（大きいほど速いが，入力列が最短でなくなることがある）
+    戻り値：結果の辞書
+        reachable：ドアに着けたらTrue，調べ尽くしても着けなかったらFalse，探索を打ち切ったらNone
+                   （近い状態をまとめて調べるので，Falseは「この細かさでは見つからない」という意味）
+        ticks：ドアまでのステップ数
+        inputs：ステップごとの（押しっぱなしのキー, 押したキー）のリスト
+        nodes：調べた状態数
+        seconds：かかった時間[秒]
+    """
+    t0 = time.perf_counter()
+    pg.init()
+    game = game_mod.Game([level])
+    cycle = apple_cycle(level["apples"], game_mod.stage_world(level).height)
+    key_states = [game_mod.KeyState(held) for held in HELD]
+    events = [game_mod.keydown_events(keys) for keys in KEYDOWNS]
+    actions = [(h, k) for h in range(len(HELD)) for k in range(len(KEYDOWNS))]
+    door = game.stage.door_rect
+    if door is None:
+        return {"reachable": False, "ticks": None, "inputs": None, "nodes": 0,
+                "seconds": time.perf_counter() - t0}
+    bird_w = game.bird.rct.width
+    step_x = game_mod.Bird.delta[pg.K_RIGHT][0]
+
+    def phase(t: int) -> int:
+        if cycle is None or t < cycle[0]:
+            return t
+        start, period = cycle
+        return start + (t - start) % period
+
+    def cell(state: tuple, t: int) -> tuple:
+        (x, y), vy, _, _, g_switch, _, _, flag = state[:8]
+        return (x // CELL_X, y // CELL_Y, round(vy / CELL_VY), g_switch, flag, phase(t) // CELL_T)
+
+    def remaining(state: tuple) -> float:
+        x = state[0][0]
+        gap = max(door.left - (x + bird_w), x - door.right, 0)
+        return gap / step_x * weight
+
+    start = game.snapshot()
+    parents = {cell(start, 0): None}  # 状態→（1つ前の状態, 行動）
+    heap = [(remaining(start), 0, 0, start)]  # 同じ見積もりなら先に進んでいる状態を優先する
+    truncated = False
+    goal = None
+    while heap and goal is None:
+        _, neg_t, _, state = heapq.heappop(heap)
+        t = -neg_t
+        if t >= max_ticks:
+            truncated = True
+            continue
+        here = cell(state, t)
+        game.restore(state)
+        # 空中でのSPACEは何もしないのと同じ．ただしstep()は先にhit_stage()でflagを決め直すので，
+        # 保存したflagが空中でも床に重なっていれば（着地するステップなら）ジャンプできる
+        rct = game.bird.rct
+        airborne = state[7] and all(not rct.colliderect(r) for r in game.stage.platform_grid.query(rct))
+        for h, k in actions:
+            if k == 1 and airborne:
+                continue
+            game.restore(state)
+            result = game.step(key_states[h], events[k])
+            if result == "goal":
+                goal = (here, (h, k))
+                break
+            if result is not None:  # りんごかとげに当たった
+                continue
+            new = game.snapshot()
+            key = cell(new, t + 1)
+            if key in parents:
+                continue
+            parents[key] = (here, (h, k))
+            if len(parents) > max_nodes:
+                truncated = True
+                heap.clear()
+                break
+            heapq.heappush(heap, (t + 1 + remaining(new), -(t + 1), len(parents), new))
+
+    inputs = None
+    if goal is not None:
+        inputs = []
+        node, action = goal
+        while action is not None:
+            h, k = action
+            inputs.append((frozenset(HELD[h]), list(KEYDOWNS[k])))
+            parent = parents[node]
+            node, action = parent if parent is not None else (None, None)
+        inputs.reverse()
+    return {
+        "reachable": True if goal is not None else (None if truncated else False),
+        "ticks": None if inputs is None else len(inputs),
+        "inputs": inputs,
+        "nodes": len(parents),
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def verify(level: dict, inputs: list) -> bool:
+    """
+    求めた入力列を新しいゲームで再生し，本当にゴールできるかを確かめる
+    引数1 level：ステージのデータ
+    引数2 inputs：solve_level()が返した入力列
+    戻り値：ゴールできたらTrue
+    """
+    result, _ = game_mod.run_headless(inputs, levels=[level])
+    return result == "goal"
+
+
+def solve_levels(levels: list[dict], workers: int | None = None, **kwargs) -> list[dict]:
+    """
+    複数のステージをプロセスプールで並列に調べる
+    引数1 levels：ステージのデータのリスト
+    引数2 workers：プロセス数（Noneならコア数）
+    引数3 kwargs：solve_level()に渡す引数
+    戻り値：ステージごとのsolve_level()の結果のリスト
+    """
+    if len(levels) <= 1 or workers == 1:
+        return [solve_level(level, **kwargs) for level in levels]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(solve_level, level, **kwargs) for level in levels]
+        return [f.result() for f in futures]
+
+
+def save_replay(inputs: list, path: str):
+    """
+    入力列をリプレイファイルとして書き出す（Gravity_koukaton.py --replay で再生できる）
+    引数1 inputs：solve_level()が返した入力列
+    引数2 path：書き出すファイルのパス
+    """
+    recorder = InputRecorder()
+    for held, keydowns in inputs:
+        recorder.record(game_mod.KeyState(held), game_mod.keydown_events(keydowns))
+    recorder.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default=LEVEL_FILE, help="調べるステージデータファイル")
+    parser.add_argument("--workers", type=int, help="並列に動かすプロセス数（省略時はコア数）")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS, help="探索する最大ステップ数")
+    parser.add_argument("--max-nodes", type=int, default=MAX_NODES, help="探索する最大状態数")
+    parser.add_argument("--weight", type=float, default=WEIGHT, help="距離の見積もりの重み（1.0で最短の入力列）")
+    parser.add_argument("--replay-dir", help="見つけた入力列をステージごとのリプレイファイルとして書き出すフォルダ")
+    args = parser.parse_args()
+
+    levels = load_levels(args.levels)
+    t0 = time.perf_counter()
+    results = solve_levels(levels, args.workers, max_ticks=args.max_ticks,
+                           max_nodes=args.max_nodes, weight=args.weight)
+    unsolved = 0
+    for i, (level, r) in enumerate(zip(levels, results)):
+        if r["reachable"]:
+            ok = "ok" if verify(level, r["inputs"]) else "NG (再生結果が一致しない)"
+            status = f"reachable in {r['ticks']} ticks, replay {ok}"
+            if args.replay_dir:
+                os.makedirs(args.replay_dir, exist_ok=True)
+                save_replay(r["inputs"], os.path.join(args.replay_dir, f"stage{i + 1}.rep"))
+        else:
+            unsolved += 1
+            status = "unreachable" if r["reachable"] is False else "unknown (探索を打ち切った)"
+        print(f"stage{i + 1}: {status}  ({r['nodes']} states, {r['seconds']:.2f}s)")
+    print(f"total {time.perf_counter() - t0:.2f}s")
+    pg.quit()
+    return 1 if unsolved else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+当たり判定の候補を絞り込むための空間ハッシュ
+"""
+import pygame as pg
+
+
+CELL_SIZE = 64  # 1マスの大きさ[px]
+
+
+def _order(item: tuple[int, object]) -> int:
+    return item[0]
+
+
+class SpatialHash:
+    """
+    画面を一定の大きさのマスに区切り，各マスに重なっているオブジェクトを覚えておくクラス
+    あるRectに重なりうるオブジェクトだけを取り出せる
+    床やとげのように動かないものを登録する（ステージが変わったら作り直す）
+    """
+    def __init__(self, cell_size: int = CELL_SIZE):
+        """
+        引数 cell_size：1マスの大きさ
+        """
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], list[tuple[int, object]]] = {}  # マス→(登録順, obj)のリスト
+        self._count = 0  # 登録したオブジェクトの数（次の登録順）
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _span(self, rct: pg.Rect) -> tuple[int, int, int, int]:
+        """
+        Rectが重なるマスの範囲を返す
+        引数 rct：対象のRect
+        戻り値：（左端の列, 上端の行, 右端の列, 下端の行）
+        """
+        size = self.cell_size
+        return (rct.left // size, rct.top // size,
+                (rct.right - 1) // size, (rct.bottom - 1) // size)
+
+    def _add_cells(self, span: tuple[int, int, int, int], item: tuple[int, object]):
+        x0, y0, x1, y1 = span
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                self._cells.setdefault((cx, cy), []).append(item)
+
+    def insert(self, obj, rct: pg.Rect):
+        """
+        オブジェクトを登録する
+        引数1 obj：登録するオブジェクト
+        引数2 rct：オブジェクトの範囲
+        """
+        order = self._count
+        self._count += 1
+        self._add_cells(self._span(rct), (order, obj))
+
+    def query(self, rct: pg.Rect) -> list:
+        """
+        Rectと同じマスにあるオブジェクトを登録順に返す
+        引数 rct：調べる範囲
+        戻り値：当たっている可能性のあるオブジェクトのリスト
+        """
+        x0, y0, x1, y1 = self._span(rct)
+        cells = self._cells
+        if x0 == x1 and y0 == y1:
+            return [obj for _, obj in sorted(cells.get((x0, y0), ()), key=_order)]
+        found = {}
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                for order, obj in cells.get((cx, cy), ()):
+                    found[order] = obj
+        return [found[order] for order in sorted(found)]
+
+    def clear(self):
+        """
+        登録をすべて消す
+        """
+        self._cells.clear()
+        self._count = 0
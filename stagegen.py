@@ -0,0 +1,166 @@
+"""
+ステージを乱数で自動生成し，クリアできるものだけをステージデータファイルに書き出す
+候補はプロセスプールで並列に作り，ソルバー（solver.py）でゲームと同じ物理演算を使って確かめる
+例：python stagegen.py -n 100 --seed 1 --out generated.json
+    python Gravity_koukaton.py --levels generated.json
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import Gravity_koukaton as game_mod
+import solver
+from levels import save_levels
+
+
+WIDTH, HEIGHT = game_mod.WIDTH, game_mod.HEIGHT
+PLATFORM_H = 20  # 床の厚さ[px]
+PLATFORMS = (4, 10)  # 床の数の範囲
+APPLE_COLUMNS = (1, 3)  # りんごの列の数の範囲
+APPLES_PER_COLUMN = (3, 6)  # 1列あたりのりんごの数の範囲
+APPLE_SPEEDS = (-2, -1, 1, 2)  # りんごの縦方向の速度の選択肢
+THORN_STRIPS = (0, 3)  # 床の上に置くとげの列の数の範囲
+SAFE_LEFT = 150  # りんごやとげを置かない左端の幅（スタート地点の周り）
+SAFE_RIGHT = 150  # りんごやとげを置かない右端の幅（ドアの周り）
+MAX_NODES = 15_000  # 1つの候補を調べる最大状態数（超えたら難しすぎるとして捨てる）
+BATCH = 64  # まとめてプロセスプールに渡す候補の数の上限
+DIFFICULTY = (1.0, 1.5)  # 残す難しさの範囲（既定値）
+
+
+def bird_size() -> tuple[int, int]:
+    """
+    こうかとんの画像の大きさ（ドアも同じ大きさ）をゲーム本体の画像から求める
+    戻り値：（幅, 高さ）[px]
+    """
+    game_mod.Bird.load_images()
+    return game_mod.Bird.img1.get_size()
+
+
+def generate(seed: int) -> dict:
+    """
+    シードから1つのステージを作る（同じシードからは同じステージができる）
+    左端の床の上にスタート地点，右端の床の上にドアを置き，間に床・りんご・とげを並べる
+    引数 seed：乱数のシード
+    戻り値：ステージのデータ
+    """
+    rng = random.Random(seed)
+    bird_h = bird_size()[1]
+    start_y = rng.randrange(200, HEIGHT - 100, 10)
+    door_y = rng.randrange(100, HEIGHT - 100, 10)
+    platforms = [
+        [0, start_y, rng.randrange(100, 250, 10), PLATFORM_H],
+        [WIDTH - rng.randrange(100, 250, 10), door_y, 300, PLATFORM_H],
+    ]
+    for _ in range(rng.randint(*PLATFORMS)):
+        w = rng.randrange(20, 300, 10)
+        platforms.append([rng.randrange(0, WIDTH - w, 10), rng.randrange(40, HEIGHT - 60, 10), w, PLATFORM_H])
+
+    apples = []
+    columns = rng.sample(range(SAFE_LEFT, WIDTH - SAFE_RIGHT, 50), rng.randint(*APPLE_COLUMNS))
+    for x in columns:
+        n = rng.randint(*APPLES_PER_COLUMN)
+        vy = rng.choice(APPLE_SPEEDS)
+        offset = rng.randrange(0, 100)
+        apples.extend([x, 15 + (offset + i * 600 // n) % 600, vy] for i in range(n))
+
+    # 画面の上下端は既存のステージと同じくとげで埋め，床の上にもとげを置く
+    thorns = [[[10, 630], 60, "upper"], [[10, 20], 60, "under"]]
+    middle = [p for p in platforms[2:] if SAFE_LEFT < p[0] and p[0] + p[2] < WIDTH - SAFE_RIGHT and p[2] >= 40]
+    for x, y, w, _ in rng.sample(middle, min(len(middle), rng.randint(*THORN_STRIPS))):
+        count = rng.randint(1, max(1, w // 40))
+        thorns.append([[x + 10, y - 23], count, "upper"])
+
+    return {
+        "platforms": platforms,
+        "door": [WIDTH - 60, door_y - bird_h],
+        "start": [30, start_y - bird_h // 2],
+        "apples": apples,
+        "thorns": thorns,
+    }
+
+
+def difficulty(level: dict, ticks: int) -> float:
+    """
+    ステージの難しさを，クリアにかかるステップ数と横に歩くだけでかかるステップ数の比で表す
+    1.0なら右に歩くだけでクリアでき，大きいほど回り道や待ち時間が必要になる
+    引数1 level：ステージのデータ
+    引数2 ticks：ソルバーが見つけた入力列のステップ数
+    戻り値：難しさ
+    """
+    walk = max(1, (level["door"][0] - level["start"][0] - bird_size()[0]) / 3)
+    return ticks / walk
+
+
+def evaluate(seed: int, max_nodes: int = MAX_NODES) -> tuple[int, dict, float | None]:
+    """
+    シードからステージを作ってソルバーで確かめる（プロセスプールの中で呼ばれる）
+    引数1 seed：乱数のシード
+    引数2 max_nodes：ソルバーが調べる最大状態数
+    戻り値：（シード, ステージのデータ, 難しさ（クリアできなければNone））のタプル
+    """
+    level = generate(seed)
+    r = solver.solve_level(level, max_nodes=max_nodes)
+    if not r["reachable"]:
+        return seed, level, None
+    return seed, level, difficulty(level, r["ticks"])
+
+
+def generate_levels(count: int, seed: int = 0, difficulty_range: tuple[float, float] = DIFFICULTY,
+                    workers: int | None = None, max_nodes: int = MAX_NODES,
+                    max_candidates: int | None = None) -> tuple[list[dict], int]:
+    """
+    クリアできて難しさが範囲内のステージをcount個集める
+    候補のシードはseed*1000003から順に使うので，同じ引数からは同じ結果になる
+    引数1 count：集めるステージ数
+    引数2 seed：乱数のシード
+    引数3 difficulty_range：残す難しさの（下限, 上限）
+    引数4 workers：プロセス数（Noneならコア数）
+    引数5 max_nodes：1つの候補をソルバーが調べる最大状態数
+    引数6 max_candidates：試す候補数の上限（Noneならcountの100倍）
+    戻り値：（ステージのデータのリスト, 試した候補数）のタプル
+    """
+    lo, hi = difficulty_range
+    max_candidates = max_candidates or count * 100
+    base = seed * 1000003
+    found: list[dict] = []
+    tried = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while len(found) < count and tried < max_candidates:
+            size = min(BATCH, max(workers or os.cpu_count() or 1, (count - len(found)) * 2))  # 足りない数の2倍まで
+            seeds = range(base + tried, base + min(tried + size, max_candidates))
+            tried += len(seeds)
+            for _, level, score in pool.map(evaluate, seeds, [max_nodes] * len(seeds)):
+                if score is not None and lo <= score <= hi and len(found) < count:
+                    found.append(level)
+    return found, tried
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=10, help="作るステージ数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--out", default="generated.json", help="書き出すステージデータファイル")
+    parser.add_argument("--min-difficulty", type=float, default=DIFFICULTY[0], help="残す難しさの下限")
+    parser.add_argument("--max-difficulty", type=float, default=DIFFICULTY[1], help="残す難しさの上限")
+    parser.add_argument("--workers", type=int, help="並列に動かすプロセス数（省略時はコア数）")
+    parser.add_argument("--max-nodes", type=int, default=MAX_NODES, help="1つの候補を調べる最大状態数")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    levels, tried = generate_levels(args.n, args.seed, (args.min_difficulty, args.max_difficulty),
+                                    args.workers, args.max_nodes)
+    elapsed = time.perf_counter() - t0
+    if levels:
+        save_levels(levels, args.out)
+    print(f"{len(levels)} stages from {tried} candidates in {elapsed:.1f}s "
+          f"({len(levels) / elapsed * 60:.0f} stages/min) -> {args.out}")
+    return 0 if len(levels) == args.n else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())